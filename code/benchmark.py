@@ -0,0 +1,150 @@
+"""On-device micro benchmarks
+
+Run on the module REPL:
+    import usr.benchmark
+    usr.benchmark.main()
+"""
+import utime
+from usr.libs.quantize import Quantizer
+from usr.libs import geo
+from usr.libs.pypubsub import Publisher, SYNC
+
+
+def timeit(func, args=(), number=1000):
+    """average cost of `func(*args)` in microseconds"""
+    start = utime.ticks_us()
+    for _ in range(number):
+        func(*args)
+    return utime.ticks_diff(utime.ticks_us(), start) / number
+
+
+def report(name, baseline_us, optimized_us):
+    print('{:<32} baseline {:>9.1f} us  optimized {:>9.1f} us  x{:.1f}'.format(
+        name, baseline_us, optimized_us, baseline_us / optimized_us if optimized_us else 0))
+
+
+# string based rounding formerly used by SensorService, kept as benchmark baseline
+def _count_decimal_digits(value):
+    s = str(value)
+    if '.' not in s:
+        return 0
+    return len(s.split('.')[1])
+
+
+def _round_if_needed(value):
+    if abs(value) > 100.0:
+        return 0.0
+    if _count_decimal_digits(value) > 15:
+        for precision in range(15, 7, -1):
+            rounded = round(value, precision)
+            if _count_decimal_digits(rounded) <= 15:
+                return rounded
+        return 0.0
+    return value
+
+
+def bench_quantize(number=1000):
+    # typical ICM20948 reading: raw ADC / 16384 * 9.8
+    accel = [(123 / 16384.0) * 9.8, (-4567 / 16384.0) * 9.8, (16001 / 16384.0) * 9.8]
+    quantizer = Quantizer(1000, limit=100.0)
+
+    def baseline():
+        return {1: _round_if_needed(accel[0]), 2: _round_if_needed(accel[1]), 3: _round_if_needed(accel[2])}
+
+    report('accel xyz rounding', timeit(baseline, number=number), timeit(quantizer.vector, (accel,), number=number))
+
+
+# bisection asin formerly used by gnss_service on firmware without `math`, kept as benchmark baseline
+def _asin_bisection(x):
+    low, high = -1, 1
+    while abs(high - low) > 1e-10:
+        mid = (low + high) / 2.0
+        if geo.sin(mid) < x:
+            low = mid
+        else:
+            high = mid
+    return (low + high) / 2.0
+
+
+def bench_geo(number=1000):
+    # ~50 m movement check, as done by GnssService on every fix
+    lat0, lng0, lat1, lng1 = 31.8463, 117.1988, 31.8467, 117.1990
+    origin = geo.Origin(lat0, lng0)
+    report('50 m distance check', timeit(geo.haversine, (lat0, lng0, lat1, lng1), number), timeit(origin.distance, (lat1, lng1), number))
+    print('    haversine {:.4f} m, fast path {:.4f} m'.format(geo.haversine(lat0, lng0, lat1, lng1) * 1000, origin.distance(lat1, lng1) * 1000))
+    report('asin (no math module)', timeit(_asin_bisection, (0.0039,), number // 10), timeit(geo.asin_series, (0.0039,), number))
+
+
+def _wait_count(counter, target, timeout_ms=10000):
+    start = utime.ticks_ms()
+    while counter[0] < target and utime.ticks_diff(utime.ticks_ms(), start) < timeout_ms:
+        utime.sleep_ms(1)
+
+
+def bench_pubsub_workers(messages=20, slow_ms=20):
+    # fast sensor samples published next to a listener doing I/O (e.g. a cloud send)
+    fast_topic = 'sensor/sample'
+    received = [0]
+
+    def fast_listener(**kwargs):
+        received[0] += 1
+
+    def slow_listener(**kwargs):
+        utime.sleep_ms(slow_ms)
+
+    for workers in (1, 4):
+        # pick a slow topic on another shard, as a well spread topic set would be
+        slow_topic = 'cloud/send'
+        n = 0
+        while workers > 1 and hash(slow_topic) % workers == hash(fast_topic) % workers:
+            n += 1
+            slow_topic = 'cloud/send/{}'.format(n)
+        pub = Publisher(workers, stats=True)
+        pub.subscribe(fast_topic, fast_listener)
+        pub.subscribe(slow_topic, slow_listener)
+        pub.listen()  # worker threads stay idle after the run
+        received[0] = 0
+        start = utime.ticks_us()
+        for i in range(messages):
+            pub.publish(slow_topic, i=i)
+            pub.publish(fast_topic, i=i)
+        _wait_count(received, messages)
+        elapsed = utime.ticks_diff(utime.ticks_us(), start)
+        stats = pub.stats()
+        print('{} worker(s): {} fast messages in {} us, fast latency avg {} us max {} us, slow pending {}'.format(
+            workers, received[0], elapsed, stats[fast_topic]['avg_latency_us'], stats[fast_topic]['max_latency_us'],
+            stats[slow_topic]['pending']))
+
+
+def bench_pubsub_latency(number=200):
+    # publish -> listener latency of a flag flipping listener, queued vs SYNC delivery
+    latency = [0, 0]  # total us, count
+
+    def listener(t):
+        latency[0] += utime.ticks_diff(utime.ticks_us(), t)
+        latency[1] += 1
+
+    pub = Publisher()
+    pub.subscribe('queued', listener)
+    pub.subscribe('sync', listener)
+    pub.set_policy('sync', SYNC)
+    pub.listen()  # the worker thread stays idle after the run
+    result = {}
+    for topic in ('queued', 'sync'):
+        latency[0] = latency[1] = 0
+        for i in range(number):
+            pub.publish(topic, t=utime.ticks_us())
+            _wait_count(latency, i + 1)  # one message in flight, end-to-end latency only
+        result[topic] = latency[0] / float(latency[1])
+    report('publish -> listener latency', result['queued'], result['sync'])
+
+
+def main():
+    bench_quantize()
+    bench_geo()
+    bench_pubsub_workers()
+    bench_pubsub_latency()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,86 @@
-from usr.extensions.qth_client import QthClient
-from usr.extensions.gnss_service import GnssService
-from usr.extensions.lbs_service import LbsService
-from usr.extensions.sensor_service import SensorService
-from usr.extensions.fan_service import FanService
-from usr.extensions.buzzer_service import BuzzerService
-from usr.extensions.sim_service import SIMService
-
-
-qth_client = QthClient()
-gnss_service = GnssService()
-lbs_service = LbsService()
-sensor_service = SensorService()
-fan_service = FanService()
-buzzer_service = BuzzerService()
-sim_service = SIMService()
+"""Extension instances, constructed lazily
+
+Every name below is a proxy. The service module is imported when the proxy is
+registered with `init_app(app)`. The service itself is only constructed on its
+`load()` or first attribute access, after the config has been read, and then
+takes the proxy's place in the application. Extensions turned off in the
+"EXTENSIONS" config section ({"sensor_service": false, ...}) are never
+registered, imported or constructed.
+"""
+from usr.libs.threading import Lock
+from usr.libs.logging import getLogger
+
+logger = getLogger(__name__)
+
+
+class LazyExtension(object):
+    lazy = True  # lets the real service replace this proxy in Application.register
+
+    def __init__(self, name, cls_name):
+        self.name = name  # also the module name in usr.extensions
+        self.__cls_name = cls_name
+        self.__cls = None
+        self.__instance = None
+        self.__app = None
+        self.__lock = Lock()
+
+    def __str__(self):
+        return self.__cls_name
+
+    def __enter__(self):
+        return self.instance.__enter__()
+
+    def __exit__(self, *args, **kwargs):
+        return self.instance.__exit__(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.instance, name)
+
+    @property
+    def cls(self):
+        if self.__cls is None:
+            module = __import__('usr.extensions.' + self.name, None, None, [self.__cls_name])
+            # importing the submodule rebinds the package attribute of the same name, put the proxy back
+            globals()[self.name] = self
+            self.__cls = getattr(module, self.__cls_name)
+        return self.__cls
+
+    @property
+    def depends(self):
+        return getattr(self.cls, 'depends', ())
+
+    @property
+    def blocking(self):
+        return getattr(self.cls, 'blocking', True)
+
+    @property
+    def instance(self):
+        if self.__instance is None:
+            with self.__lock:
+                if self.__instance is None:
+                    instance = self.cls()
+                    if self.__app is not None:
+                        instance.init_app(self.__app)
+                    self.__instance = instance
+        return self.__instance
+
+    def init_app(self, app):
+        if not app.config.get('EXTENSIONS', {}).get(self.name, True):
+            logger.info('extension {} disabled by config'.format(self.name))
+            return
+        self.cls  # import now, construction waits for load() or first use
+        self.__app = app
+        app.register(self.name, self)
+
+    def load(self):
+        self.instance.load()
+
+
+net_service = LazyExtension('net_service', 'NetService')
+qth_client = LazyExtension('qth_client', 'QthClient')
+gnss_service = LazyExtension('gnss_service', 'GnssService')
+lbs_service = LazyExtension('lbs_service', 'LbsService')
+sensor_service = LazyExtension('sensor_service', 'SensorService')
+fan_service = LazyExtension('fan_service', 'FanService')
+buzzer_service = LazyExtension('buzzer_service', 'BuzzerService')
+sim_service = LazyExtension('sim_service', 'SIMService')
@@ -1,7 +1,7 @@
 import utime
 from usr.libs.threading import Thread, Lock
 from usr.libs.logging import getLogger
-from usr.libs import CurrentApp
+from usr.libs import tsl, pypubsub, topics
 
 logger = getLogger(__name__)
 
@@ -94,6 +94,9 @@ class BuzzerService(object):
     def init_app(self, app):
         """Register buzzer service with application"""
         app.register('buzzer_service', self)
+        tsl.add_source('buzzer', self.get_buzzer_status)
+        tsl.add_property(13, 'buzzer', 'switch', kind=tsl.BOOL)  # Buzzer switch
+        pypubsub.subscribe(topics.BUZZER_SWITCH, self._on_switch_command)
 
     def load(self):
         """Load buzzer service - called by application framework"""
@@ -158,6 +161,10 @@ class BuzzerService(object):
             self._mark_buzzer_disconnected()
             return False
 
+    def _on_switch_command(self, value):
+        success = self.set_buzzer_switch(value)
+        logger.info("Buzzer switch command: {} - {}".format(value, "Success" if success else "Failed"))
+
     def _status_reporting_loop(self):
         """Background thread for periodic status reporting and reconnection"""
         reconnect_counter = 0
@@ -171,8 +178,7 @@ class BuzzerService(object):
                 
                 # Report status every 60 seconds
                 if reconnect_counter % 60 == 0:
-                    if CurrentApp().qth_client.isStatusOk():
-                        self._report_status()
+                    self._report_status()
                     
             except Exception as e:
                 pass
@@ -188,8 +194,7 @@ class BuzzerService(object):
                 13: status['switch']  # Buzzer switch (TSL ID 13)
             }
             
-            with CurrentApp().qth_client:
-                CurrentApp().qth_client.sendTsl(1, data)
+            pypubsub.publish(topics.TSL_REPORT, data=data)
                     
         except Exception as e:
             pass
\ No newline at end of file
@@ -1,7 +1,7 @@
 import utime
 from usr.libs.threading import Thread, Lock
 from usr.libs.logging import getLogger
-from usr.libs import CurrentApp
+from usr.libs import tsl, pypubsub, topics
 
 logger = getLogger(__name__)
 
@@ -82,6 +82,11 @@ class FanService(object):
     def init_app(self, app):
         """Register fan service with application"""
         app.register('fan_service', self)
+        tsl.add_source('fan', self.get_fan_status)
+        tsl.add_property(11, 'fan', 'switch', kind=tsl.BOOL)  # Fan switch
+        tsl.add_property(12, 'fan', 'mode', kind=tsl.INT)  # Fan mode
+        pypubsub.subscribe(topics.FAN_SWITCH, self._on_switch_command)
+        pypubsub.subscribe(topics.FAN_MODE, self._on_mode_command)
 
     def load(self):
         """Load fan service - called by application framework"""
@@ -218,6 +223,14 @@ class FanService(object):
             self._mark_fan_disconnected()
             return False
 
+    def _on_switch_command(self, value):
+        success = self.set_fan_switch(value)
+        logger.info("Fan switch command: {} - {}".format(value, "Success" if success else "Failed"))
+
+    def _on_mode_command(self, value):
+        success = self.set_fan_mode(value)
+        logger.info("Fan mode command: {} - {}".format(value, "Success" if success else "Failed"))
+
     def _status_reporting_loop(self):
         """Background thread for periodic status reporting and reconnection"""
         reconnect_counter = 0
@@ -231,8 +244,7 @@ class FanService(object):
                 
                 # Report status every 60 seconds
                 if reconnect_counter % 60 == 0:
-                    if CurrentApp().qth_client.isStatusOk():
-                        self._report_status()
+                    self._report_status()
                     
             except Exception as e:
                 pass
@@ -249,8 +261,7 @@ class FanService(object):
                 12: status['mode']     # Fan mode (TSL ID 12)
             }
             
-            with CurrentApp().qth_client:
-                CurrentApp().qth_client.sendTsl(1, data)
+            pypubsub.publish(topics.TSL_REPORT, data=data)
                     
         except Exception as e:
             pass
\ No newline at end of file
@@ -1,103 +1,95 @@
 import utime
 import quecgnss
-from usr.libs import CurrentApp
+from usr.libs import CurrentApp, tsl
 from usr.libs.threading import Thread
 from usr.libs.logging import getLogger
+from usr.libs.nmea import NmeaParser, RMC
+from usr.libs.track import TrackBuffer
+from usr.libs.frame import FrameEncoder, TRACK
+from usr.libs.geo import Origin
+from usr.libs.geofence import Geofence
+from usr.libs.odometer import Odometer
+from usr.libs.gnss_cache import FixCache
+from usr.libs.quantize import Quantizer
 import _thread
 from .import qth_client
-try:
-    from math import sin, asin, cos, radians, fabs, sqrt
-except:
-    from cmath import sin as csin, cos as ccos, pi
-
-    def radians(x):
-        return x * pi / 180.0
-    
-    def fabs(x):
-        return x if x > 0 else -x
-
-    def sin(x):
-        return csin(x).real
-    
-    def cos(x):
-        return ccos(x).real
-    
-    def asin(x):
-        low, high = -1, 1
-        while abs(high - low) > 1e-10:  # 精度控制
-            mid = (low + high) / 2.0
-            if sin(mid) < x:
-                low = mid
-            else:
-                high = mid
-        return (low + high) / 2.0
-
 
 logger = getLogger(__name__)
 
 
-EARTH_RADIUS = 6371  # 地球平均半径大约6371km
-GLOBAL_DISTANCE = 0  # 里程km
-
-
-def hav(theta):
-    s = sin(theta / 2)
-    return s * s
 
-
-def gps_distance(lat0, lng0, lat1, lng1):
-    # 用haversine公式计算球面两点间的距离
-    # 经纬度转换成弧度
-    lat0 = radians(lat0)
-    lat1 = radians(lat1)
-    lng0 = radians(lng0)
-    lng1 = radians(lng1)
-    dlng = fabs(lng0 - lng1)
-    dlat = fabs(lat0 - lat1)
-    h = hav(dlat) + cos(lat0) * cos(lat1) * hav(dlng)
-    distance = 2 * EARTH_RADIUS * asin(pow(h, 0.5))  # km
-    # distance = int(distance * 1000)  # m
-    return distance
-
-
-class NmeaDict(dict):
-
-    @classmethod
-    def load(cls, raw):
-        items = {}
-        for line in raw.split('\r\n'):
-            try:
-                tail_index = line.rfind('*')
-                if tail_index == -1:
-                    continue
-                head_index = line.rfind('$', 0, tail_index)
-                if head_index == -1:
-                    continue
-                crc = int(line[tail_index + 1:tail_index + 3], 16)
-                if cls.checksum(line[head_index + 1:tail_index]) != crc:
-                    raise ValueError('CRC check failed')
-                cmdlist = line[head_index:tail_index].split(',')
-                # print(line[head_index:])
-                if cmdlist[0] not in items:
-                    items[cmdlist[0]] = []
-                items[cmdlist[0]].append(line)
-            except Exception as e:
-                # logger.debug('parse nmea line error: {}; pass it: {}'.format(e, line))
-                continue
-        return cls(items)
-
-    @staticmethod
-    def checksum(data):
-        crc = ord(data[0])
-        for one in (ord(_) for _ in data[1:]):
-            crc ^= one
-        return crc
+# Positioning policy, overridden by "GNSS" in config.json
+DEFAULT_GNSS = {
+    'interval': 1,  # fastest NMEA read interval, seconds
+    'power_save': True,  # duty cycle GNSS while SensorService reports the device stationary
+    'stationary_after': 120,  # seconds without motion before duty cycling
+    'stationary_interval': 0,  # read interval while stationary, 0 turns the GNSS engine off
+    'speed_intervals': [[5, 10], [30, 5], [80, 2]],  # [below km/h, read interval seconds]
+}
+
+# Batched trajectory upload, overridden by "TRACK" in config.json, see usr.libs.track.TrackBuffer
+DEFAULT_TRACK = {
+    'enabled': False,
+    'tolerance': 10,  # meters
+    'max_points': 64,
+    'max_age': 300,  # seconds
+    'turn_angle': 45,  # degrees
+}
+TRACK_SCALE = 100000  # 1e-5 degree, ~1.1m
+
+# Geofence transitions, overridden by "GEOFENCE" in config.json, see usr.libs.geofence
+# Events are reported on `tsl_id` as struct {1: fence id, 2: 1 enter / 2 exit}
+DEFAULT_GEOFENCE = {
+    'enabled': False,
+    'path': '/usr/geofence.json',
+    'tsl_id': 30,
+    'dwell': 2,  # consecutive fixes confirming a transition
+}
+
+# Mileage integrated over every valid fix, overridden by "ODOMETER" in config.json, see usr.libs.odometer
+DEFAULT_ODOMETER = {
+    'enabled': False,
+    'path': '/usr/odometer.json',
+    'tsl_id': 31,  # km, reported whenever the total is persisted
+    'max_hdop': 5.0,
+    'min_speed': 3.0,  # km/h
+    'max_speed': 300.0,  # km/h
+    'save_interval': 300,  # seconds
+    'save_distance': 1.0,  # km
+}
+ODOMETER_QUANTIZER = Quantizer(1000)  # 1 m
+
+# Warm start cache, overridden by "GNSS_CACHE" in config.json, see usr.libs.gnss_cache
+# Time to first fix after boot is reported once on `tsl_id` as struct {1: ttff ms, 2: 0 cold / 1 warm}
+DEFAULT_GNSS_CACHE = {
+    'enabled': False,
+    'path': '/usr/gnss_cache.json',
+    'tsl_id': 32,
+    'save_interval': 600,  # seconds
+    'max_age': 4 * 3600,  # seconds, older positions are not injected
+}
 
 
 class GnssService(object):
+    blocking = False  # quecgnss init takes seconds, nothing needs to wait for it
 
     def __init__(self, app=None):
         self.__gnss = quecgnss
+        self.__parser = NmeaParser()
+        self.config = DEFAULT_GNSS
+        self.track = None
+        self.__track_encoder = None
+        self.geofence = None
+        self.__geofence_tsl_id = None
+        self.__geofence_pending = []  # events not delivered yet, at most one per fence
+        self.odometer = None
+        self.__odometer_tsl_id = None
+        self.fix_cache = None
+        self.__ttff_tsl_id = None
+        self.__ttff_start = None
+        self.__ttff = None  # measured time to first fix, until delivered
+        self.__warm_start = False
+        self.__qth_client = None  # resolved once the update thread starts, None without cloud connection
         if app is not None:
             self.init_app(app)
 
@@ -106,12 +98,50 @@ class GnssService(object):
 
     def init_app(self, app):
         app.register('gnss_service', self)
+        self.config = dict(DEFAULT_GNSS)
+        self.config.update(app.config.get('GNSS', {}))
+        track = dict(DEFAULT_TRACK)
+        track.update(app.config.get('TRACK', {}))
+        if track.pop('enabled'):
+            self.track = TrackBuffer(**track)
+            # channels: latitude, longitude, seconds since the first point
+            self.__track_encoder = FrameEncoder([(1, TRACK_SCALE), (2, TRACK_SCALE), (3, 1)], self.track.max_points + 1, TRACK)
+        geofence = dict(DEFAULT_GEOFENCE)
+        geofence.update(app.config.get('GEOFENCE', {}))
+        if geofence['enabled']:
+            try:
+                self.geofence = Geofence.load(geofence['path'], geofence['dwell'])
+                self.__geofence_tsl_id = geofence['tsl_id']
+                logger.info('{} loaded {} geofences'.format(self, len(self.geofence)))
+            except Exception as e:
+                logger.error('{} load geofences from {} failed: {}'.format(self, geofence['path'], e))
+        odometer = dict(DEFAULT_ODOMETER)
+        odometer.update(app.config.get('ODOMETER', {}))
+        if odometer.pop('enabled'):
+            self.__odometer_tsl_id = odometer.pop('tsl_id')
+            self.odometer = Odometer(odometer.pop('path'), **odometer)
+            tsl.add_source('odometer', lambda: self.odometer.total)
+            tsl.add_property(self.__odometer_tsl_id, 'odometer', fmt=ODOMETER_QUANTIZER)  # mileage km
+            logger.info('{} odometer {:.3f} km'.format(self, self.odometer.total))
+        cache = dict(DEFAULT_GNSS_CACHE)
+        cache.update(app.config.get('GNSS_CACHE', {}))
+        if cache['enabled']:
+            self.__ttff_tsl_id = cache['tsl_id']
+            if getattr(self.__gnss, 'injectLocation', None) is None:
+                # no way to use a cached fix, spare the flash writes
+                logger.info('{} quecgnss has no injectLocation, fixes are not cached'.format(self))
+            else:
+                self.fix_cache = FixCache(cache['path'], cache['save_interval'], cache['max_age'])
 
     def load(self):
         logger.info('loading {} extension, init quecgnss will take some seconds'.format(self))
+        if self.__ttff_tsl_id is not None:
+            self.__ttff_start = utime.ticks_ms()
         result = self.init()
         logger.info('{} init gnss res: {}'.format(self, result))
         if result:
+            if self.fix_cache is not None:
+                self.__warm_start = self._inject_assistance(self.fix_cache.get())
             Thread(target=self.start_update).start()
 
     def init(self):
@@ -130,96 +160,188 @@ class GnssService(object):
         return self.__gnss.gnssEnable(bool(flag)) == 0
 
     def read(self, size=4096):
+        """Feed newly available NMEA data to the parser, return the fix record if it got a new valid position"""
         raw = self.__gnss.read(size)
         if raw != -1:
             size, data = raw
             # logger.debug('gnss read raw {} bytes data:\n{}'.format(size, data))
-            return NmeaDict.load(data)
+            if size and self.__parser.feed(data):
+                return self.__parser.fix
+
+    def _inject_assistance(self, cached):
+        """Hand the cached position to the engine, return True only if it was injected
+
+        The documented quecgnss API (init/get_state/gnssEnable/read) has no position injection, so
+        on current QuecPython firmware this is a no-op and every start is reported cold. A build
+        that provides `quecgnss.injectLocation(lat, lng, altitude)` returning 0 gets warm starts.
+        """
+        inject_location = getattr(self.__gnss, 'injectLocation', None)
+        if cached is None or inject_location is None:
+            return False
+        try:
+            injected = inject_location(cached['lat'], cached['lng'], cached['altitude']) == 0
+        except Exception as e:
+            logger.warn('{} inject cached location failed: {}'.format(self, e))
+            return False
+        logger.info('{} warm start: {}, cached fix: {}'.format(self, injected, cached))
+        return injected
+
+    def _measure_ttff(self):
+        self.__ttff = utime.ticks_diff(utime.ticks_ms(), self.__ttff_start)
+        self.__ttff_start = None
+        logger.info('{} time to first fix {} ms ({} start)'.format(self, self.__ttff, 'warm' if self.__warm_start else 'cold'))
+
+    def _report_ttff(self):
+        """Send the measured TTFF, kept until the cloud is connected and the send succeeds"""
+        if self.__qth_client is None or not self.__qth_client.isStatusOk():
+            return
+        with self.__qth_client:
+            if self.__qth_client.sendTsl(1, {self.__ttff_tsl_id: {1: self.__ttff, 2: int(self.__warm_start)}}):
+                self.__ttff = None
+
+    def _cloud(self):
+        try:
+            return CurrentApp().qth_client
+        except KeyError:
+            logger.warn('{} qth_client disabled, positions and events are not reported'.format(self))
+            return None
+
+    def _motion(self):
+        try:
+            return CurrentApp().sensor_service.motion
+        except Exception:
+            return None  # no sensor service, GNSS stays always on
+
+    def _next_interval(self, fix):
+        """Read interval ramped with speed: slow movement needs fewer fixes"""
+        interval = self.config['interval']
+        for speed, slow_interval in self.config['speed_intervals']:
+            if fix.speed < speed:
+                return max(slow_interval, interval)
+        return interval
+
+    def _idle(self, motion):
+        """Duty cycle GNSS while the device is stationary, return when it should read again"""
+        stationary_interval = self.config['stationary_interval']
+        if stationary_interval > 0:
+            motion.wait_motion(timeout=stationary_interval)
+            return
+        logger.info('{} device stationary, turn gnss engine off'.format(self))
+        self.enable(False)
+        while not motion.wait_motion(timeout=60):
+            if not motion.stationary(self.config['stationary_after']):
+                break  # motion data lost, fail safe to positioning
+        self.enable(True)
+        self.__parser.reset()
+        logger.info('{} motion detected, turn gnss engine on'.format(self))
+
+    def _check_geofence(self, lat, lng):
+        """Evaluate the fix against the geofences and report transitions right away"""
+        pending = self.__geofence_pending
+        for fence_id, event in self.geofence.evaluate(lat, lng):
+            logger.info('geofence {} {}'.format(fence_id, 'enter' if event == 1 else 'exit'))
+            for item in pending:
+                if item[1] == fence_id:
+                    # the undelivered opposite transition: the cloud state is already right
+                    pending.remove(item)
+                    break
+            else:
+                pending.append({1: fence_id, 2: event})
+        if not pending or self.__qth_client is None or not self.__qth_client.isStatusOk():
+            return  # offline, keep the events for a later fix
+        while pending:
+            with self.__qth_client:
+                for _ in range(3):
+                    if self.__qth_client.sendTsl(1, {self.__geofence_tsl_id: pending[0]}):
+                        break
+                else:
+                    logger.error('send geofence event fail, retry on next fix')
+                    return
+            pending.pop(0)
+
+    def _update_odometer(self, fix):
+        # HDOP only comes with GGA sentences, satellites stay 0 without them
+        self.odometer.update(fix.lat, fix.lng, fix.speed if fix.source == RMC else None, fix.hdop if fix.satellites else None)
+        if self.odometer.save() and self.__qth_client is not None:
+            with self.__qth_client:
+                self.__qth_client.sendTsl(1, {self.__odometer_tsl_id: ODOMETER_QUANTIZER(self.odometer.total)})
+
+    def _send_track(self, nmea_data):
+        """Flush the simplified trajectory as one binary frame, plus the latest sentence for the live location"""
+        points = self.track.flush()
+        encoder = self.__track_encoder
+        encoder.reset()
+        t0 = points[0][TrackBuffer.T]
+        for t, lat, lng in points:
+            encoder.add((int(round(lat * TRACK_SCALE)), int(round(lng * TRACK_SCALE)), t - t0))
+        frame = bytes(encoder.encode(t0, 0))
+        with self.__qth_client:
+            for _ in range(3):
+                if self.__qth_client.sendTrans(1, frame):
+                    logger.debug('send track of {} points ({} bytes) success'.format(len(points), len(frame)))
+                    break
+            else:
+                logger.error('send track to qth server fail, drop {} points'.format(len(points)))
+            self.__qth_client.sendGnss(nmea_data)
 
     def start_update(self):
-        prev_lat_and_lng = None
+        prev_origin = None
+        self.__qth_client = self._cloud()
+        motion = self._motion()
 
         while True:
-            nmea_dict = self.read()
-            if nmea_dict is None:
-                utime.sleep(3)
-                continue
-
-            nmea_data = None
-
-            if nmea_data is None:
-                if "$GNRMC" in nmea_dict:
-                    for temp in nmea_dict["$GNRMC"]:
-                        nmea_tuple = temp.split(",")
-                        if nmea_tuple[2] == "A":
-                            nmea_data = temp
-
-                            lat_string = nmea_tuple[3]
-                            lat_high = float(lat_string[:2])
-                            lat_low = float(lat_string[2:]) / 60
-                            lat = lat_high + lat_low
-                            if nmea_tuple[4] == "S":
-                                lat = -lat
-                            
-                            lng_string = nmea_tuple[5]  # 11755.787896484374（单位：分）
-                            lng_high = float(lng_string[:3])
-                            lng_low = float(lng_string[3:]) / 60
-                            lng = lng_high + lng_low
-                            if nmea_tuple[6] == "W":
-                                lng = -lng
+            if self.config['power_save'] and motion is not None and motion.stationary(self.config['stationary_after']):
+                self._idle(motion)
 
-                            break
+            fix = self.read()
+            if fix is None:
+                utime.sleep(self.config['interval'])
+                continue
 
-            if nmea_data is None:
-                if "$GNGGA" in nmea_dict:
-                    for temp in nmea_dict["$GNGGA"]:
-                        nmea_tuple = temp.split(",")
-                        if nmea_tuple[6] != "0":
-                            nmea_data = temp
-
-                            lat_string = nmea_tuple[2]
-                            lat_high = float(lat_string[:2])
-                            lat_low = float(lat_string[2:]) / 60
-                            lat = lat_high + lat_low
-                            if nmea_tuple[3] == "S":
-                                lat = -lat
-
-                            lng_string = nmea_tuple[4]  # 11755.787896484374（单位：分）
-                            lng_high = float(lng_string[:3])
-                            lng_low = float(lng_string[3:]) / 60
-                            lng = lng_high + lng_low
-                            if nmea_tuple[5] == "W":
-                                lng = -lng
-                                
+            nmea_data, lat, lng = fix.sentence, fix.lat, fix.lng
+            # logger.debug("GPS data: {}".format(nmea_data))
+            # logger.debug("prev_origin: {}".format(prev_origin))
+            logger.debug("lat_and_lng: {}".format((lat, lng)))
+            if self.__ttff_start is not None:
+                self._measure_ttff()
+            if self.__ttff is not None:
+                self._report_ttff()
+            if self.fix_cache is not None:
+                self.fix_cache.update(fix)
+            if self.geofence is not None:
+                self._check_geofence(lat, lng)
+            if self.odometer is not None:
+                self._update_odometer(fix)
+            if self.__qth_client is None:
+                pass  # nowhere to report the location, only the local state above is kept
+            elif prev_origin is None:
+                # 首次定位
+                for _ in range(3):
+                    with self.__qth_client:
+                        if self.__qth_client.sendGnss(nmea_data):
+                            prev_origin = Origin(lat, lng)
+                            logger.error("send gnss to qth server success")
                             break
-            
-            if nmea_data is not None:
-                # logger.debug("GPS data: {}".format(nmea_data))
-                # logger.debug("prev_lat_and_lng: {}".format(prev_lat_and_lng))
-                logger.debug("lat_and_lng: {}".format((lat, lng)))
-                if prev_lat_and_lng is None:
-                    # 首次定位
+                else:
+                    logger.error("send gnss to qth server fail")
+                # the batch keeps filling while offline, flush it when due like any other fix
+                if self.track is not None and self.track.add(utime.time(), lat, lng):
+                    self._send_track(nmea_data)
+            elif self.track is not None:
+                # 轨迹抽稀后批量上报
+                if self.track.add(utime.time(), lat, lng):
+                    self._send_track(nmea_data)
+            else:
+                # 或者位移超过 50m，则上报
+                distance = prev_origin.distance(lat, lng)
+                logger.debug('distance delta: {:f}'.format(distance))
+                if distance >= 0.05:
                     for _ in range(3):
-                        with CurrentApp().qth_client:
-                            if CurrentApp().qth_client.sendGnss(nmea_data):
-                                prev_lat_and_lng = (lat, lng)
+                        with self.__qth_client:
+                            if self.__qth_client.sendGnss(nmea_data):
+                                prev_origin = Origin(lat, lng)
                                 logger.error("send gnss to qth server success")
                                 break
                     else:
                         logger.error("send gnss to qth server fail")
-                else:
-                    # 或者位移超过 50m，则上报
-                    distance = gps_distance(prev_lat_and_lng[0], prev_lat_and_lng[1], lat, lng)
-                    logger.debug('distance delta: {:f}'.format(distance))
-                    if distance >= 0.05:
-                        for _ in range(3):
-                            with CurrentApp().qth_client:
-                                if CurrentApp().qth_client.sendGnss(nmea_data):
-                                    prev_lat_and_lng = (lat, lng)
-                                    logger.error("send gnss to qth server success")
-                                    break
-                        else:
-                            logger.error("send gnss to qth server fail")
-            utime.sleep(3)
-
-
+            utime.sleep(self._next_interval(fix))
@@ -1,81 +1,161 @@
 import net
 import utime
-from usr.libs import CurrentApp
-from usr.libs.threading import Thread
+from usr.libs import CurrentApp, pypubsub, topics
+from usr.libs.threading import Thread, Lock, Event
 from usr.libs.logging import getLogger
-import _thread  
+import _thread
 
 logger = getLogger(__name__)
 
 
+# Cell based location policy, overridden by "LBS" in config.json
+DEFAULT_LBS = {
+    'poll_interval': 10,  # seconds between net.getCellInfo() polls
+    'heartbeat': 1800,  # seconds, report even if the serving cell did not change
+    'min_interval': 60,  # seconds, a change back to a recently seen cell or a refresh is not reported sooner
+    'max_cells': 4,  # serving cell plus strongest neighbours per message
+    'cache_size': 8,  # recently seen serving cells kept to damp ping-pong between cells
+}
+
+# net.getCellInfo() tuple indexes of (mcc, mnc, lac/tac, cid, rssi) for the gsm, umts and lte lists
+CELL_FIELDS = (
+    (2, 3, 4, 1, 7),
+    (3, 4, 5, 1, 8),
+    (2, 3, 5, 1, 7),
+)
+
+
 class LbsService(object):
+    depends = ('sim_service', 'qth_client')  # cell info needs a registered SIM, reports need the cloud
 
     def __init__(self, app=None):
         self.__net = net
+        self.config = DEFAULT_LBS
+        self.__lock = Lock()
+        self.__refresh = Event()  # set by put_lbs(), handled by the update thread
+        self.__recent = []  # [(cell key, last seen)], most recent first
+        self.__reported = None  # serving cell key of the last report
+        self.__reported_at = None
+        self.__qth_client = None
         if app is not None:
             self.init_app(app)
 
     def __str__(self):
         return '{}'.format(type(self).__name__)
-    
+
 
     def init_app(self, app):
         app.register('lbs_service', self)
+        self.config = dict(DEFAULT_LBS)
+        self.config.update(app.config.get('LBS', {}))
+        # queued requests collapse into one, put_lbs() only wakes the update thread anyway
+        pypubsub.set_policy(topics.LBS_REPORT, pypubsub.COALESCE)
+        pypubsub.subscribe(topics.LBS_REPORT, self.put_lbs)
 
     def load(self):
         logger.info('loading {} extension, init lbs will take some seconds'.format(self))
         Thread(target=self.start_update).start()
 
+    def cells(self):
+        """Current cells as [((mcc, mnc, lac, cid), rssi)], serving cell first then by signal strength"""
+        cell_info = self.__net.getCellInfo()
+        if cell_info == -1:
+            return []
+        serving = []
+        neighbours = []
+        for rat, fields in enumerate(CELL_FIELDS):
+            if rat >= len(cell_info):
+                break
+            mcc, mnc, lac, cid, rssi = fields
+            for cell in cell_info[rat]:
+                item = ((cell[mcc], cell[mnc], cell[lac], cell[cid]), cell[rssi])
+                # flag 0 marks the serving cell
+                (serving if cell[0] == 0 else neighbours).append(item)
+        neighbours.sort(key=lambda item: item[1], reverse=True)
+        return (serving + neighbours)[:self.config['max_cells']]
+
+    @staticmethod
+    def format(cells):
+        return ''.join(
+            "$LBS,{},{},{},{},{},0*69;".format(key[0], key[1], key[2], key[3], rssi) for key, rssi in cells
+        )
+
     def read(self):
-        cell_info = net.getCellInfo()
-        if cell_info != -1 and cell_info[2]:
-            first_tuple = cell_info[2]
-            lbs_data = "$LBS,{},{},{},{},{},0*69;".format(
-                first_tuple[0][2],
-                first_tuple[0][3],
-                first_tuple[0][5],
-                first_tuple[0][1],
-                first_tuple[0][7]
-            )
-            return lbs_data
+        cells = self.cells()
+        if cells:
+            return self.format(cells)
+
+    def _changed(self, key, now):
+        """True if `key` is a real serving cell change worth a report"""
+        if key == self.__reported:
+            return False
+        if self.__reported_at is None:
+            return True
+        for recent, _ in self.__recent:
+            if recent == key:
+                # back to a cell seen moments ago: cell edge ping-pong, report at most every min_interval
+                return utime.ticks_diff(now, self.__reported_at) >= self.config['min_interval'] * 1000
+        return True
+
+    def _remember(self, key, now):
+        self.__recent = [item for item in self.__recent if item[0] != key]
+        self.__recent.insert(0, (key, now))
+        del self.__recent[self.config['cache_size']:]
+
+    def _send(self, cells):
+        lbs_data = self.format(cells)
+        if self.__qth_client is None:
+            try:
+                self.__qth_client = CurrentApp().qth_client
+            except KeyError:
+                logger.debug("qth_client disabled, lbs data is not reported")
+                return False
+        if not self.__qth_client.isStatusOk():
+            return False  # not connected yet, the change stays unreported and is retried on the next poll
+        for _ in range(3):
+            with self.__qth_client:
+                if self.__qth_client.sendLbs(lbs_data):
+                    logger.debug("send lbs data of {} cells to qth server success".format(len(cells)))
+                    return True
+        logger.debug("send lbs data to qth server fail")
+        return False
+
+    def poll(self, refresh=False):
+        """Read the cells and report them on a serving cell change or heartbeat. A `refresh`
+        also reports unchanged cells, at most every min_interval"""
+        with self.__lock:
+            cells = self.cells()
+            if not cells:
+                return False
+            now = utime.ticks_ms()
+            key = cells[0][0]
+            elapsed = None if self.__reported_at is None else utime.ticks_diff(now, self.__reported_at)
+            due = elapsed is None or elapsed >= self.config['heartbeat'] * 1000 or \
+                (refresh and elapsed >= self.config['min_interval'] * 1000)
+            changed = self._changed(key, now)
+            self._remember(key, now)
+            if not (due or changed):
+                return False
+            if changed:
+                logger.info("serving cell changed {} -> {}".format(self.__reported, key))
+        # the lock is not held across the cloud round trips
+        if not self._send(cells):
+            return False
+        with self.__lock:
+            self.__reported = key
+            self.__reported_at = now
+        return True
 
     def start_update(self):
+        refresh = False
         while True:
-            lbs_data = self.read()
-            if lbs_data is None:
-                utime.sleep(2)
-                continue
-
-            for _ in range(3):
-                with CurrentApp().qth_client:
-                    if CurrentApp().qth_client.sendLbs(lbs_data):
-                        break
-            else:
-                logger.debug("send lbs data to qth server fail, next report will be after 2 seconds")
-                utime.sleep(2)
-                continue
-            
-            logger.debug("send lbs data to qth server success, next report will be after 1800 seconds")
-            utime.sleep(1800)
-            
-    def put_lbs(self):
-            while True:
-                lbs_data = self.read()
-                if lbs_data is None:
-                    utime.sleep(2)
-                    continue
-
-                for _ in range(3):
-                    with CurrentApp().qth_client:
-                        if CurrentApp().qth_client.sendLbs(lbs_data):
-                            break
-                else:
-                    logger.debug("send lbs data to qth server fail, next report will be after 2 seconds")
-                    utime.sleep(2)
-                    continue
-                
-                logger.debug("send LBS data to qth server success")
-                break
-            
+            try:
+                self.poll(refresh)
+            except Exception as e:
+                logger.error("{} poll cells failed: {}".format(self, e))
+            refresh = self.__refresh.wait(timeout=self.config['poll_interval'], clear=True)
 
-                
+    def put_lbs(self):
+        """Ask the update thread for a report, e.g. when the platform reads the TSL model. Unchanged
+        cells are only reported again after min_interval"""
+        self.__refresh.set()
@@ -0,0 +1,131 @@
+import net
+import utime
+import dataCall
+from usr.libs.threading import Thread, Event, Lock
+from usr.libs.logging import getLogger
+from usr.libs.tracer import boot
+from usr.libs import pypubsub, topics
+
+logger = getLogger(__name__)
+
+
+# Data call settings, overridden by "NETWORK" in config.json
+DEFAULT_NETWORK = {
+    'profile_id': 1,
+    'ip_type': 0,  # 0 IPv4, 1 IPv6, 2 IPv4v6
+    'apn': 'BICSAPN',
+    'username': '',
+    'password': '',
+    'auth_type': 0,
+    'retry_interval': 2,  # seconds between PDP context activation attempts
+    'check_interval': 30,  # seconds, fallback state check if no data call callback arrives
+}
+
+
+class NetService(object):
+    """Network attach driven by dataCall/net callbacks
+
+    `load()` returns immediately, the data call is activated in the background.
+    Cloud dependent code waits on `wait_ready()` while everything else starts
+    in parallel with the network attach.
+    """
+    depends = ('sim_service',)
+
+    def __init__(self, app=None):
+        self.config = DEFAULT_NETWORK
+        self.ready = Event()
+        self.__lock = Lock()
+        self.__attaching = False
+        self.__start = None
+        if app is not None:
+            self.init_app(app)
+
+    def __str__(self):
+        return '{}'.format(type(self).__name__)
+
+    def init_app(self, app):
+        app.register('net_service', self)
+        self.config = dict(DEFAULT_NETWORK)
+        self.config.update(app.config.get('NETWORK', {}))
+
+    def load(self):
+        logger.info('loading {} extension, network attach runs in background'.format(self))
+        self.__start = utime.ticks_ms()
+        boot.begin('network')
+        dataCall.setCallback(self.__on_data_call)
+        set_net_callback = getattr(net, 'setCallback', None)
+        if set_net_callback is not None:
+            set_net_callback(self.__on_net_event)
+        if not self.check():
+            self.__attach_async()
+
+    def is_ready(self):
+        return self.ready.is_set()
+
+    def wait_ready(self, timeout=None):
+        """block until the data call is up, return False on timeout"""
+        return self.ready.wait(timeout=timeout)
+
+    def check(self):
+        """query the data call state and update the readiness event, return True if connected"""
+        info = dataCall.getInfo(self.config['profile_id'], self.config['ip_type'])
+        connected = info != -1 and info[2][0] == 1
+        self.__set_ready(connected)
+        return connected
+
+    def __set_ready(self, connected):
+        if connected and not self.ready.is_set():
+            if self.__start is not None:
+                logger.info('{} network ready after {} ms'.format(self, utime.ticks_diff(utime.ticks_ms(), self.__start)))
+                self.__start = None
+            else:
+                logger.info('{} network ready'.format(self))
+            boot.end('network')
+            self.ready.set()
+            pypubsub.publish(topics.NETWORK, ready=True)
+        elif not connected and self.ready.is_set():
+            logger.warn('{} network lost'.format(self))
+            self.ready.clear()
+            pypubsub.publish(topics.NETWORK, ready=False)
+
+    def __attach_async(self):
+        with self.__lock:
+            if self.__attaching:
+                return
+            self.__attaching = True
+        Thread(target=self.attach).start()
+
+    def attach(self):
+        """activate the PDP context, then wait for the data call callback"""
+        config = self.config
+        try:
+            while True:
+                if dataCall.setPDPContext(
+                        config['profile_id'], config['ip_type'], config['apn'],
+                        config['username'], config['password'], config['auth_type']) == 0 \
+                        and dataCall.activate(config['profile_id']) == 0:
+                    break
+                logger.debug('{} waiting for network connection...'.format(self))
+                utime.sleep(config['retry_interval'])
+            # the callback normally sets the event, the check covers a missed callback
+            while not self.ready.wait(timeout=config['check_interval']):
+                if self.check():
+                    break
+        finally:
+            with self.__lock:
+                self.__attaching = False
+
+    def __on_data_call(self, args):
+        # (profile id, network state, ...), the IP info that may follow differs between firmwares
+        if len(args) < 2 or args[0] != self.config['profile_id']:
+            return
+        state = args[1]
+        self.__set_ready(state == 1)
+        if state != 1:
+            self.__start = utime.ticks_ms()
+            self.__attach_async()
+
+    def __on_net_event(self, args):
+        logger.debug('{} net event: {}'.format(self, args))
+        if self.ready.is_set():
+            self.check()
@@ -1,15 +1,34 @@
-from usr.libs.threading import Lock
+from usr.libs.threading import Lock, Thread
 from usr.libs.logging import getLogger
 from usr import Qth
-from usr.libs import CurrentApp
-from . import lbs_service
+from usr.libs import CurrentApp, tsl, pypubsub, topics
+from usr.libs.tracer import boot
 logger = getLogger(__name__)
 
 
+# Boot timeline diagnostics, overridden by "BOOT_TRACE" in config.json
+# Published once after the first connection on `tsl_id` as text, see usr.libs.tracer.Tracer.summary
+DEFAULT_BOOT_TRACE = {
+    'enabled': False,
+    'tsl_id': 33,
+    'timeout': 120,  # seconds to wait for the application to finish loading
+}
+
+# TSL ids written by the cloud -> (command topic, value type)
+COMMANDS = {
+    11: (topics.FAN_SWITCH, bool),
+    12: (topics.FAN_MODE, int),
+    13: (topics.BUZZER_SWITCH, bool),
+}
+
+
 class QthClient(object):
+    depends = ('net_service',)
 
     def __init__(self, app=None):
         self.opt_lock = Lock()
+        self.boot_trace = DEFAULT_BOOT_TRACE
+        self.__boot_trace_sent = False
         if app:
             self.init_app(app)
     
@@ -22,6 +41,14 @@ class QthClient(object):
 
     def init_app(self, app):
         app.register("qth_client", self)
+        self.boot_trace = dict(DEFAULT_BOOT_TRACE)
+        self.boot_trace.update(app.config.get('BOOT_TRACE', {}))
+        # commands keep running in the Qth callback thread, as the direct calls did
+        for topic, _ in COMMANDS.values():
+            pypubsub.set_policy(topic, pypubsub.SYNC)
+        # periodic samples share the default worker with status/network: never let them pile up
+        pypubsub.set_policy(topics.TSL_REPORT, pypubsub.DROP_OLDEST)
+        pypubsub.subscribe(topics.TSL_REPORT, self.__on_tsl_report)
         Qth.init()
         Qth.setProductInfo(app.config["QTH_PRODUCT_KEY"], app.config["QTH_PRODUCT_SECRET"])
         Qth.setServer(app.config["QTH_SERVER"])
@@ -42,12 +69,34 @@ class QthClient(object):
         Qth.setAppVer(app.config["APP_version"], self.App_appResultCb)
     
     def load(self):
-        self.start()
+        try:
+            net_service = CurrentApp().net_service
+        except KeyError:
+            self.start()  # no network service, assume the data call is already up
+            return
+        logger.info("QTH connection waits for network")
+        pypubsub.subscribe(topics.NETWORK, self.__on_network)
+        if net_service.is_ready():
+            self.start()
+
+    def __on_network(self, ready):
+        if ready:
+            self.start()
+
+    def __on_tsl_report(self, data):
+        # checked before taking the lock, so samples are dropped without waiting while offline
+        if not self.isStatusOk():
+            return
+        # a single attempt keeps the shared worker free, the next periodic sample replaces a lost one
+        with self:
+            if not self.sendTsl(1, data):
+                logger.error("send tsl report {} fail".format(list(data.keys())))
 
     def start(self):
         with self.opt_lock:
             if not Qth.state():
                 logger.info("Starting QTH connection")
+                boot.begin('qth connect')
                 Qth.start()
             else:
                 logger.debug("QTH connection already active")
@@ -62,6 +111,9 @@ class QthClient(object):
     def sendTsl(self, mode, value):
         return Qth.sendTsl(mode, value)
 
+    def sendTrans(self, mode, data):
+        return Qth.sendTrans(mode, data)
+
     def isStatusOk(self):
         return Qth.state()
 
@@ -75,6 +127,21 @@ class QthClient(object):
         logger.info("dev event:{} result:{}".format(event, result))
         if(2== event and 0 == result):
             Qth.otaRequest()
+            boot.end('qth connect')
+            if self.boot_trace['enabled'] and not self.__boot_trace_sent:
+                self.__boot_trace_sent = True
+                Thread(target=self.__publish_boot_trace).start()
+
+    def __publish_boot_trace(self):
+        boot.finished.wait(timeout=self.boot_trace['timeout'])
+        summary = boot.summary()
+        with self:
+            for _ in range(3):
+                if self.sendTsl(1, {self.boot_trace['tsl_id']: summary}):
+                    logger.info("boot timeline published")
+                    break
+            else:
+                logger.error("publish boot timeline fail")
 
     def recvTransCallback(self, value):
         ret = Qth.sendTrans(1, value)
@@ -85,108 +152,22 @@ class QthClient(object):
             logger.info("recvTsl:{}".format(value))
             for cmdId, val in value.items():
                 logger.info("recvTsl {}:{}".format(cmdId, val))
-                
-                # Handle fan control commands
-                if cmdId == 11:  # Fan switch control
-                    try:
-                        fan_service = CurrentApp().fan_service
-                        logger.info("Raw fan switch value: {} (type: {})".format(val, type(val)))
-                        success = fan_service.set_fan_switch(bool(val))
-                        logger.info("Fan switch command: {} (converted to: {}) - {}".format(val, bool(val), "Success" if success else "Failed"))
-                    except Exception as e:
-                        logger.error("Failed to process fan switch command: {}".format(e))
-                        
-                elif cmdId == 12:  # Fan mode control
-                    try:
-                        fan_service = CurrentApp().fan_service
-                        success = fan_service.set_fan_mode(int(val))
-                        logger.info("Fan mode command: {} - {}".format(val, "Success" if success else "Failed"))
-                    except Exception as e:
-                        logger.error("Failed to process fan mode command: {}".format(e))
-                        
-                elif cmdId == 13:  # Buzzer switch control
-                    try:
-                        buzzer_service = CurrentApp().buzzer_service
-                        success = buzzer_service.set_buzzer_switch(bool(val))
-                        logger.info("Buzzer switch command: {} - {}".format(val, "Success" if success else "Failed"))
-                    except Exception as e:
-                        logger.error("Failed to process buzzer switch command: {}".format(e))
+                command = COMMANDS.get(cmdId)
+                if command is None:
+                    continue
+                topic, kind = command
+                try:
+                    pypubsub.publish(topic, value=kind(val))
+                except Exception as e:
+                    logger.error("Failed to process {} command: {}".format(topic, e))
+
     def readTslCallback(self, ids, pkgId):
         logger.info("readTsl ids:{} pkgId:{}".format(ids, pkgId))
-        value = dict()
-        
-        # Get sensor data with hot-plug support
-        temp1, humi = None, None
-        try:
-            temp1, humi = CurrentApp().sensor_service.get_temp1_and_humi()
-        except Exception as e:
-            pass
-        
-        press, temp2 = None, None
-        try:
-            press, temp2 = CurrentApp().sensor_service.get_press_and_temp2()
-        except Exception as e:
-            pass
-        
-        # TCS34725 color sensor data reporting disabled
-        # r, g, b = None, None, None
-        # try:
-        #     r, g, b = CurrentApp().sensor_service.get_rgb888()
-        # except Exception as e:
-        #     pass
-
-        accel, gyro = None, None
-        try:
-            accel, gyro = CurrentApp().sensor_service.get_accel_gyro()
-        except Exception as e:
-            pass
-
-        # Get fan status
-        fan_status = None
-        try:
-            fan_status = CurrentApp().fan_service.get_fan_status()
-        except Exception as e:
-            pass
+        # Only the sources backing the requested ids are polled
+        value = tsl.read(ids)
 
-        # Get buzzer status
-        buzzer_status = None
-        try:
-            buzzer_status = CurrentApp().buzzer_service.get_buzzer_status()
-        except Exception as e:
-            pass
-
-        # Build response based on requested IDs and data availability
-        for id in ids:
-            if id == 3 and temp1 is not None:
-                value[3] = temp1
-            elif id == 4 and humi is not None:
-                value[4] = humi
-            elif id == 5 and temp2 is not None:
-                value[5] = temp2
-            elif id == 6 and press is not None:
-                value[6] = press
-            # TCS34725 color sensor data reporting disabled
-            # elif id == 7 and r is not None and g is not None and b is not None:
-            #     value[7] = {1: r, 2: g, 3: b}
-            elif id == 9 and gyro is not None:
-                value[9] = {1: CurrentApp().sensor_service.round_if_needed(gyro[0]), 2: CurrentApp().sensor_service.round_if_needed(gyro[1]), 3: CurrentApp().sensor_service.round_if_needed(gyro[2])}
-            elif id == 10 and accel is not None:
-                value[10] = {1: CurrentApp().sensor_service.round_if_needed(accel[0]), 2: CurrentApp().sensor_service.round_if_needed(accel[1]), 3: CurrentApp().sensor_service.round_if_needed(accel[2])}
-            elif id == 11 and fan_status is not None:
-                value[11] = fan_status['switch']
-            elif id == 12 and fan_status is not None:
-                value[12] = fan_status['mode']
-            elif id == 13 and buzzer_status is not None:
-                value[13] = buzzer_status['switch']
-            else:
-                pass
-
-        # LBS service
-        try:
-            lbs = lbs_service.LbsService()
-            lbs.put_lbs()
-        except Exception as e:
-            pass
+        # LBS service reports the cells in the background
+        pypubsub.publish(topics.LBS_REPORT)
 
         Qth.ackTsl(1, value, pkgId)
        
@@ -1,8 +1,13 @@
 import utime
 from machine import I2C
-from usr.libs import CurrentApp
-from usr.libs.threading import Thread
+from usr.libs import CurrentApp, tsl
+from usr.libs.threading import Thread, Lock
 from usr.libs.logging import getLogger
+from usr.libs.quantize import Quantizer
+from usr.libs.deadband import ChangeDetector
+from usr.libs.aggregate import WindowAggregator
+from usr.libs.frame import FrameEncoder
+from usr.libs.motion import MotionDetector
 from usr.drivers.shtc3 import Shtc3, SHTC3_SLAVE_ADDR
 from usr.drivers.lps22hb import Lps22hb, LPS22HB_SLAVE_ADDRESS
 # from usr.drivers.tcs34725 import Tcs34725, TCS34725_SLAVE_ADDR
@@ -13,11 +18,60 @@ from usr.drivers.icm20948 import ICM20948, I2C_ADD_ICM20948
 logger = getLogger(__name__)
 
 
+# Fixed per-property report resolution, readings beyond `limit` are dropped as invalid
+TEMP_QUANTIZER = Quantizer(100, limit=200.0)  # 0.01 °C
+HUMI_QUANTIZER = Quantizer(100, limit=200.0)  # 0.01 %RH
+PRESS_QUANTIZER = Quantizer(100, limit=2000.0)  # 0.01 hPa
+ACCEL_QUANTIZER = Quantizer(1000, limit=100.0)  # mm/s²
+GYRO_QUANTIZER = Quantizer(1000, limit=100.0)  # mrad/s
+
+# Report rules per TSL id, overridden by "TELEMETRY" in config.json
+DEFAULT_TELEMETRY = {
+    'default': {'deadband': 1},
+    '9': {'deadband': 0.1},  # gyroscope, rad/s L1
+    '10': {'deadband': 0.5},  # acceleration, m/s² L1
+}
+
+# Channels available to the sampler: name -> (source, extractor, quantizer)
+AGGREGATE_CHANNELS = {
+    'accel_x': ('icm20948', lambda r: r[0][0], ACCEL_QUANTIZER),
+    'accel_y': ('icm20948', lambda r: r[0][1], ACCEL_QUANTIZER),
+    'accel_z': ('icm20948', lambda r: r[0][2], ACCEL_QUANTIZER),
+    'accel_mag': ('icm20948', lambda r: (r[0][0] * r[0][0] + r[0][1] * r[0][1] + r[0][2] * r[0][2]) ** 0.5, ACCEL_QUANTIZER),
+    'gyro_x': ('icm20948', lambda r: r[1][0], GYRO_QUANTIZER),
+    'gyro_y': ('icm20948', lambda r: r[1][1], GYRO_QUANTIZER),
+    'gyro_z': ('icm20948', lambda r: r[1][2], GYRO_QUANTIZER),
+    'press': ('lps22hb', lambda r: r[0], PRESS_QUANTIZER),
+    'temp2': ('lps22hb', lambda r: r[1], TEMP_QUANTIZER),
+    'temp1': ('shtc3', lambda r: r[0], TEMP_QUANTIZER),
+    'humi': ('shtc3', lambda r: r[1], HUMI_QUANTIZER),
+}
+
+# Windowed aggregation, overridden by "AGGREGATION" in config.json
+# channels: TSL struct id -> channel name, reported as {1: min, 2: max, 3: mean, 4: stddev, 5: count}
+DEFAULT_AGGREGATION = {
+    'enabled': False,
+    'sample_rate': 50,  # Hz
+    'window': 60,  # seconds
+    'channels': {},
+}
+
+# Batched raw samples sent as binary frames through Qth passthrough, overridden by "BATCH" in config.json
+# Sampled at the AGGREGATION sample_rate; channels: frame channel id -> channel name
+DEFAULT_BATCH = {
+    'enabled': False,
+    'samples': 250,  # samples per frame
+    'channels': {},
+}
+
+
 class SensorService(object):
 
     def __init__(self, app=None):
         # i2c channel 0 
         self.i2c_channel0 = I2C(I2C.I2C1, I2C.STANDARD_MODE)
+        # Serializes bus access between the report loop, the sampler and readTsl
+        self.i2c_lock = Lock()
         
         # Sensor availability tracking
         self.sensor_available = {
@@ -27,6 +81,13 @@ class SensorService(object):
             'icm20948': False
         }
         
+        # Telemetry change detection, configured in init_app
+        self.change_detector = ChangeDetector.fromConfig(DEFAULT_TELEMETRY)
+        self.aggregation = DEFAULT_AGGREGATION
+        self.batch = DEFAULT_BATCH
+        # Stationary/moving state fed by every accelerometer read, configured in init_app
+        self.motion = MotionDetector()
+
         # Initialize sensors with hot-plug support
         self._init_sensors()
 
@@ -111,23 +172,43 @@ class SensorService(object):
 
     def init_app(self, app):
         app.register('sensor_service', self)
+        self.change_detector = ChangeDetector.fromConfig(app.config.get('TELEMETRY', DEFAULT_TELEMETRY))
+        self.aggregation = dict(DEFAULT_AGGREGATION)
+        self.aggregation.update(app.config.get('AGGREGATION', {}))
+        self.batch = dict(DEFAULT_BATCH)
+        self.batch.update(app.config.get('BATCH', {}))
+        self.motion = MotionDetector.fromConfig(app.config.get('MOTION'))
+        tsl.add_source('shtc3', self.get_temp1_and_humi)
+        tsl.add_source('lps22hb', self.get_press_and_temp2)
+        tsl.add_source('icm20948', self.get_accel_gyro)
+        tsl.add_property(3, 'shtc3', 0, fmt=TEMP_QUANTIZER)  # temperature1
+        tsl.add_property(4, 'shtc3', 1, fmt=HUMI_QUANTIZER)  # humidity
+        tsl.add_property(5, 'lps22hb', 1, fmt=TEMP_QUANTIZER)  # temperature2
+        tsl.add_property(6, 'lps22hb', 0, fmt=PRESS_QUANTIZER)  # pressure
+        # TCS34725 color sensor data reporting disabled
+        # tsl.add_property(7, 'tcs34725', kind=tsl.VECTOR)
+        tsl.add_property(9, 'icm20948', 1, kind=tsl.VECTOR, fmt=GYRO_QUANTIZER)  # gyroscope
+        tsl.add_property(10, 'icm20948', 0, kind=tsl.VECTOR, fmt=ACCEL_QUANTIZER)  # acceleration
 
     def load(self):
         logger.info('loading {} extension, init sensors will take some seconds'.format(self))
         Thread(target=self.start_update).start()
-
+        if (self.aggregation['enabled'] and self.aggregation['channels']) or (self.batch['enabled'] and self.batch['channels']):
+            Thread(target=self.start_sampling).start()
 
     def get_temp1_and_humi(self):
         """Get temperature and humidity from SHTC3 sensor with hot-plug support"""
         if not self.sensor_available['shtc3']:
             raise Exception("SHTC3 sensor not available")
-        return self.shtc3.getTempAndHumi()
+        with self.i2c_lock:
+            return self.shtc3.getTempAndHumi()
     
     def get_press_and_temp2(self):
         """Get pressure and temperature from LPS22HB sensor with hot-plug support"""
         if not self.sensor_available['lps22hb']:
             raise Exception("LPS22HB sensor not available")
-        return self.lps22hb.getTempAndPressure()
+        with self.i2c_lock:
+            return self.lps22hb.getTempAndPressure()
     
     # def get_rgb888(self):
     #     """Get RGB color values from TCS34725 sensor with hot-plug support"""
@@ -150,7 +231,8 @@ class SensorService(object):
             raise Exception("ICM20948 sensor not available")
         
         # Get raw ADC values
-        accel_raw, gyro_raw = self.icm20948.icm20948_Gyro_Accel_Read()
+        with self.i2c_lock:
+            accel_raw, gyro_raw = self.icm20948.icm20948_Gyro_Accel_Read()
         
         # Convert accelerometer from ADC to m/s²
         # ICM20948 configured for ±2g range: 16384 LSB/g
@@ -160,6 +242,7 @@ class SensorService(object):
             (accel_raw[1] / 16384.0) * 9.8,
             (accel_raw[2] / 16384.0) * 9.8
         ]
+        self.motion.add(accel_ms2)
         
         # Convert gyroscope from ADC to rad/s
         # ICM20948 configured for ±1000dps range: 32.8 LSB/dps
@@ -172,38 +255,17 @@ class SensorService(object):
         
         return accel_ms2, gyro_rads
     
-    def count_decimal_digits(self, value):
-        s = str(value)
-        if '.' not in s:
-            return 0
-        decimal_part = s.split('.')[1]
-        return len(decimal_part)
-    
-    def round_if_needed(self,value):
-        # 检查异常大数值，防止传输异常数据
-        if abs(value) > 100.0:
-            return 0.0
-            
-        if self.count_decimal_digits(value) > 15:    
-            for precision in range(15, 7, -1):
-                rounded = round(value, precision)
-                digits = self.count_decimal_digits(rounded)
-                if digits <= 15:
-                    return rounded
-            return 0.0
-        else:
-            return value 
-
+    def _cloud(self):
+        try:
+            return CurrentApp().qth_client
+        except KeyError:
+            logger.warn('{} qth_client disabled, sensor data is not reported'.format(self))
+            return None
 
     def start_update(self):
-        prev_temp1 = None
-        prev_humi = None
-        prev_press = None
-        prev_temp2 = None
-        prev_rgb888 = None
-        prev_accel = None
-        prev_gyro = None
+        # prev_rgb888 = None
         reconnect_counter = 0
+        qth_client = self._cloud()
 
         while True:
             data = {}
@@ -224,16 +286,16 @@ class SensorService(object):
             try:
                 accel, gyro = self.get_accel_gyro()           
                 
-                # Check for significant acceleration changes (>0.5 m/s² total change)
-                if prev_accel is None or abs(prev_accel[0] - accel[0]) + abs(prev_accel[1] - accel[1]) + abs(prev_accel[2] - accel[2]) > 0.5:
-                    data.update({10: {1: self.round_if_needed(accel[0]), 2: self.round_if_needed(accel[1]), 3: self.round_if_needed(accel[2])}})
-                    prev_accel = [accel[0], accel[1], accel[2]]
+                # Check for significant acceleration changes (L1 deadband, 0.5 m/s² by default)
+                accel_value = ACCEL_QUANTIZER.vector(accel)
+                if accel_value is not None and self.change_detector.sample(10, accel):
+                    data.update({10: accel_value})
                     logger.debug("Acceleration changed: X={:.3f}, Y={:.3f}, Z={:.3f} m/s²".format(accel[0], accel[1], accel[2]))
                 
-                # Check for significant gyroscope changes (>0.1 rad/s total change)
-                if prev_gyro is None or abs(prev_gyro[0] - gyro[0]) + abs(prev_gyro[1] - gyro[1]) + abs(prev_gyro[2] - gyro[2]) >= 0.1:
-                    data.update({9: {1: self.round_if_needed(gyro[0]), 2: self.round_if_needed(gyro[1]), 3: self.round_if_needed(gyro[2])}})
-                    prev_gyro = [gyro[0], gyro[1], gyro[2]]
+                # Check for significant gyroscope changes (L1 deadband, 0.1 rad/s by default)
+                gyro_value = GYRO_QUANTIZER.vector(gyro)
+                if gyro_value is not None and self.change_detector.sample(9, gyro):
+                    data.update({9: gyro_value})
                     logger.debug("Gyroscope changed: X={:.3f}, Y={:.3f}, Z={:.3f} rad/s".format(gyro[0], gyro[1], gyro[2]))
                     
             except Exception as e:
@@ -245,14 +307,14 @@ class SensorService(object):
             try:
                 temp1, humi = self.get_temp1_and_humi()
 
-                if prev_temp1 is None or abs(prev_temp1 - temp1) > 1:
-                    data.update({3: round(temp1, 2)})
-                    prev_temp1 = temp1
+                temp1_value = TEMP_QUANTIZER(temp1)
+                if temp1_value is not None and self.change_detector.sample(3, temp1):
+                    data.update({3: temp1_value})
                     logger.debug("Temperature1 changed: {:.2f}°C".format(temp1))
 
-                if prev_humi is None or abs(prev_humi - humi) > 1:
-                    data.update({4: round(humi, 2)})
-                    prev_humi = humi
+                humi_value = HUMI_QUANTIZER(humi)
+                if humi_value is not None and self.change_detector.sample(4, humi):
+                    data.update({4: humi_value})
                     logger.debug("Humidity changed: {:.2f}%RH".format(humi))
 
             except Exception as e:
@@ -264,14 +326,14 @@ class SensorService(object):
             try:
                 press, temp2 = self.get_press_and_temp2()
 
-                if prev_temp2 is None or abs(prev_temp2 - temp2) > 1:
-                    data.update({5: round(temp2, 2)})
-                    prev_temp2 = temp2
+                temp2_value = TEMP_QUANTIZER(temp2)
+                if temp2_value is not None and self.change_detector.sample(5, temp2):
+                    data.update({5: temp2_value})
                     logger.debug("Temperature2 changed: {:.2f}°C".format(temp2))
 
-                if prev_press is None or abs(prev_press - press) > 1:
-                    data.update({6: round(press, 2)})
-                    prev_press = press
+                press_value = PRESS_QUANTIZER(press)
+                if press_value is not None and self.change_detector.sample(6, press):
+                    data.update({6: press_value})
                     logger.debug("Pressure changed: {:.2f} hPa".format(press))
 
             except Exception as e:
@@ -306,23 +368,118 @@ class SensorService(object):
             #     self._mark_sensor_disconnected('tcs34725')
 
             # Send data to IoT platform if any sensor data is available
-            if data:
-                with CurrentApp().qth_client:
+            if data and qth_client is not None:
+                with qth_client:
                     for _ in range(3):
-                        if CurrentApp().qth_client.sendTsl(1, data):
+                        if qth_client.sendTsl(1, data):
+                            # Only delivered values become the new baselines, on failure
+                            # the changed properties are simply re-evaluated next round
+                            self.change_detector.sent(data.keys())
                             break
-                        else:
-                            # Reset previous values on transmission failure
-                            prev_temp1 = None
-                            prev_humi = None
-                            prev_press = None
-                            prev_temp2 = None
-                            prev_rgb888 = None
-                            prev_accel = None
-                            prev_gyro = None
 
             utime.sleep(1)
 
+    def _sampler_channels(self, config):
+        """Resolve an `{id: channel name}` config to a list of (id, source, extractor, quantizer)"""
+        channels = []
+        if not config['enabled']:
+            return channels
+        for channel_id, name in config['channels'].items():
+            if name not in AGGREGATE_CHANNELS:
+                logger.warn('unknown sampler channel \"{}\", skip it'.format(name))
+                continue
+            source, extractor, quantizer = AGGREGATE_CHANNELS[name]
+            channels.append((int(channel_id), source, extractor, quantizer))
+        return channels
+
+    def start_sampling(self):
+        """Sample configured channels at `sample_rate`, report window statistics every `window`
+        seconds and/or batched raw samples as binary frames"""
+        getters = {
+            'shtc3': self.get_temp1_and_humi,
+            'lps22hb': self.get_press_and_temp2,
+            'icm20948': self.get_accel_gyro,
+        }
+        channels = self._sampler_channels(self.aggregation)
+        batch_channels = self._sampler_channels(self.batch)
+        sources = []
+        for channel in channels + batch_channels:
+            if channel[1] not in sources:
+                sources.append(channel[1])
+
+        aggregator = WindowAggregator(len(channels)) if channels else None
+        interval = 1000 // self.aggregation['sample_rate']
+        window = self.aggregation['window'] * 1000
+        window_start = utime.ticks_ms()
+
+        encoder = None
+        if batch_channels:
+            encoder = FrameEncoder([(c[0], c[3].scale) for c in batch_channels], self.batch['samples'])
+            batch_values = [0] * len(batch_channels)
+            batch_start = None
+
+        logger.info('sampling {} aggregate and {} batch channels at {}Hz'.format(
+            len(channels), len(batch_channels), self.aggregation['sample_rate']))
+        qth_client = self._cloud()
+
+        while True:
+            tick = utime.ticks_ms()
+            readings = {}
+            for source in sources:
+                try:
+                    readings[source] = getters[source]()
+                except Exception:
+                    pass
+
+            if aggregator is not None:
+                for index, (tsl_id, source, extractor, quantizer) in enumerate(channels):
+                    reading = readings.get(source)
+                    if reading is not None:
+                        aggregator.add(index, extractor(reading))
+
+                if utime.ticks_diff(tick, window_start) >= window:
+                    window_start = tick
+                    data = {}
+                    for index, (tsl_id, source, extractor, quantizer) in enumerate(channels):
+                        value = aggregator.struct(index, quantizer)
+                        if value is not None:
+                            data[tsl_id] = value
+                    aggregator.reset()
+                    if data and qth_client is not None:
+                        with qth_client:
+                            for _ in range(3):
+                                if qth_client.sendTsl(1, data):
+                                    break
+                            else:
+                                logger.debug('send window statistics fail, drop window')
+
+            if encoder is not None:
+                # Unreadable channels hold their previous value to keep the sample grid regular
+                for index, (channel_id, source, extractor, quantizer) in enumerate(batch_channels):
+                    reading = readings.get(source)
+                    if reading is not None:
+                        value = quantizer.toInt(extractor(reading))
+                        if value is not None:
+                            batch_values[index] = value
+                if batch_start is None:
+                    batch_start = utime.time()
+                encoder.add(batch_values)
+                if encoder.full():
+                    frame = bytes(encoder.encode(batch_start, interval))
+                    encoder.reset()
+                    batch_start = None
+                    if qth_client is not None:
+                        with qth_client:
+                            for _ in range(3):
+                                if qth_client.sendTrans(1, frame):
+                                    break
+                            else:
+                                logger.debug('send sample frame fail, drop {} bytes'.format(len(frame)))
+
+            elapsed = utime.ticks_diff(utime.ticks_ms(), tick)
+            if elapsed < interval:
+                utime.sleep_ms(interval - elapsed)
+
     def _mark_sensor_disconnected(self, sensor_name):
         """Mark a sensor as disconnected when communication fails"""
         if self.sensor_available[sensor_name]:
@@ -332,4 +489,5 @@ class SensorService(object):
         """Try to reconnect all disconnected sensors"""
         for sensor_name in self.sensor_available:
             if not self.sensor_available[sensor_name]:
-                self._try_reconnect_sensor(sensor_name)
+                with self.i2c_lock:
+                    self._try_reconnect_sensor(sensor_name)
@@ -1,162 +1,205 @@
 import utime
 import sim
 from sim import vsim
+from usr.libs.common import Storage
 from usr.libs.logging import getLogger
 from usr.libs.threading import Thread
 
 logger = getLogger(__name__)
 
+
+# SIM selection, overridden by "SIM" in config.json
+DEFAULT_SIM = {
+    'path': '/usr/sim_profile.json',  # last known good SIM, tried first on the next boot
+    'priority': ['vsim', 'physical'],  # order when there is no known good SIM
+    'vsim_timeout': 10,  # seconds
+    'physical_timeout': 30,  # seconds
+    'disable_timeout': 3,  # seconds for the slot to leave vSIM after disabling it
+    'poll_interval': 0.5,  # seconds between readiness checks
+}
+
+# physical SIM status: 0=not inserted/initializing, 1=ready, 2=needs PIN, 3=PUK locked, 4=fault
+SIM_ERRORS = {2: 'requires PIN code', 3: 'is PUK locked', 4: 'fault'}
+
+
 class SIMService:
-    def __init__(self):
+    def __init__(self, app=None):
         self.current_sim_type = None  # 'vsim' or 'physical' or None
         self.is_initialized = False
         self.monitoring = False
         self.monitor_thread = None
-        
+        self.config = dict(DEFAULT_SIM)
+        self.boot_metrics = None  # {'type', 'total_ms', 'attempts': [(type, ms, ok)]} of the last initialization
+        self.__profile = None
+        if app is not None:
+            self.init_app(app)
+
     def init_app(self, app):
         self.app = app
         app.register('sim_service', self)
-        
+        self.config.update(app.config.get('SIM', {}))
+
     def load(self):
-        self.initialize_sim()
+        # the SIM may already be selected, e.g. by an earlier initialize_sim() call
+        if not self.is_initialized:
+            self.initialize_sim()
         self.start_monitoring()
-        
+
+    def __storage(self):
+        if self.__profile is None:
+            self.__profile = Storage()
+            try:
+                self.__profile.init(self.config['path'])
+            except Exception as e:
+                logger.error("Load SIM profile from {} failed: {}".format(self.config['path'], e))
+        return self.__profile
+
+    def _candidates(self):
+        """SIM types in trial order: last known good first, then the configured priority"""
+        order = list(self.config['priority'])
+        last_good = self.__storage().get('type')
+        if last_good in order:
+            order.remove(last_good)
+            order.insert(0, last_good)
+        return order
+
     def initialize_sim(self):
         logger.info("Starting SIM card initialization...")
-        
-        # Test mode: Force physical SIM usage (change back to normal logic after testing)
-        TEST_PHYSICAL_SIM_ONLY = False  # Set to True for testing, False for normal use
-        
-        if TEST_PHYSICAL_SIM_ONLY:
-            logger.info("*** Test mode: Physical SIM card only ***")
-            if self._try_physical_sim():
-                self.current_sim_type = 'physical'
-                self.is_initialized = True
-                logger.info("Physical SIM card initialization successful")
-                return True
-            else:
-                logger.error("Physical SIM card initialization failed in test mode")
-                self.current_sim_type = None
-                self.is_initialized = False
-                return False
-        
-        # Normal mode: vSIM priority, physical SIM fallback
-        # Try vSIM first
-        if self._try_vsim():
-            self.current_sim_type = 'vsim'
-            self.is_initialized = True
-            logger.info("vSIM initialization successful")
-            return True
-            
-        # vSIM failed, try physical SIM card
-        if self._try_physical_sim():
-            self.current_sim_type = 'physical'
-            self.is_initialized = True
-            logger.info("Physical SIM card initialization successful")
-            return True
-            
-        logger.error("No available SIM card detected")
+        start = utime.ticks_ms()
+        attempts = []
         self.current_sim_type = None
         self.is_initialized = False
+        for sim_type in self._candidates():
+            attempt_start = utime.ticks_ms()
+            ok = self._try(sim_type)
+            attempts.append((sim_type, utime.ticks_diff(utime.ticks_ms(), attempt_start), ok))
+            if ok:
+                self.current_sim_type = sim_type
+                self.is_initialized = True
+                break
+        total = utime.ticks_diff(utime.ticks_ms(), start)
+        self.boot_metrics = {'type': self.current_sim_type, 'total_ms': total, 'attempts': attempts}
+        if self.is_initialized:
+            logger.info("{} SIM initialization successful in {} ms, attempts: {}".format(self.current_sim_type, total, attempts))
+            self._save_profile(total)
+            return True
+        logger.error("No available SIM card detected after {} ms, attempts: {}".format(total, attempts))
+        return False
+
+    def _save_profile(self, total_ms):
+        profile = self.__storage()
+        if profile.get('type') == self.current_sim_type and profile.get('boot_ms') is not None:
+            return  # unchanged, spare the flash write
+        try:
+            with profile:
+                profile['type'] = self.current_sim_type
+                profile['boot_ms'] = total_ms
+                profile.save()
+        except Exception as e:
+            logger.error("Save SIM profile failed: {}".format(e))
+
+    def _try(self, sim_type):
+        if sim_type == 'vsim':
+            return self._try_vsim()
+        if sim_type == 'physical':
+            return self._try_physical_sim()
+        logger.error("Unknown SIM type \"{}\"".format(sim_type))
         return False
-        
+
+    def _wait(self, check, timeout):
+        """poll `check()` until it returns True/False or `timeout` seconds pass, None means keep waiting"""
+        deadline = utime.ticks_add(utime.ticks_ms(), int(timeout * 1000))
+        while True:
+            result = check()
+            if result is not None:
+                return result
+            if utime.ticks_diff(deadline, utime.ticks_ms()) <= 0:
+                return False
+            utime.sleep(self.config['poll_interval'])
+
     def _try_vsim(self):
         try:
+            if vsim.queryState() == 1:
+                logger.debug("vSIM already enabled")
+                return True
             logger.debug("Trying to enable vSIM...")
             vsim.enable()
-            utime.sleep(1)
-            
-            # Wait up to 10 seconds for vSIM to enable
-            for i in range(10):
-                state = vsim.queryState()
-                if state == 1:  # vSIM enabled successfully
-                    logger.debug("vSIM status check successful")
-                    return True
-                utime.sleep(1)
-                
+            if self._wait(lambda: True if vsim.queryState() == 1 else None, self.config['vsim_timeout']):
+                logger.debug("vSIM status check successful")
+                return True
             logger.debug("vSIM enable timeout")
             return False
-            
+
         except Exception as e:
             logger.debug("vSIM initialization failed: {}".format(e))
             return False
-            
+
+    def _physical_state(self):
+        sim_status = sim.getStatus()
+        if sim_status == 1:
+            return True
+        if sim_status in SIM_ERRORS:
+            logger.warn("Physical SIM card {}".format(SIM_ERRORS[sim_status]))
+            return False
+        return None  # not inserted or still initializing
+
     def _try_physical_sim(self):
         try:
             logger.debug("Trying to use physical SIM card...")
-            
-            # Ensure vSIM is disabled
+
+            # Ensure vSIM is disabled, the physical SIM is only visible once it is. Disable
+            # unconditionally, a vSIM enable that timed out may still be in progress
             try:
                 vsim.disable()
-                utime.sleep(3)  # Increase wait time
+                self._wait(lambda: True if vsim.queryState() != 1 else None, self.config['disable_timeout'])
                 logger.debug("vSIM disabled, waiting for physical SIM initialization...")
             except:
                 pass
-                
-            # Check physical SIM status multiple times, allowing sufficient initialization time
-            for attempt in range(15):  # Maximum 15 attempts, total 30 seconds
-                sim_status = sim.getStatus()
-                logger.debug("Physical SIM check [{}/15]: status={}".format(attempt+1, sim_status))
-                
-                # SIM status meanings: 0=not inserted/initializing, 1=ready, 2=needs PIN, 3=PUK locked, 4=fault
-                if sim_status == 1:
-                    logger.info("Physical SIM card ready!")
-                    return True
-                elif sim_status == 2:
-                    logger.warning("Physical SIM card requires PIN code")
-                    return False
-                elif sim_status == 3:
-                    logger.warning("Physical SIM card is PUK locked")
-                    return False
-                elif sim_status == 4:
-                    logger.warning("Physical SIM card fault")
-                    return False
-                    
-                # Status is 0, continue waiting
-                if attempt < 14:  # Not the last attempt
-                    utime.sleep(2)
-                    
-            logger.warning("Physical SIM card not ready within 30 seconds, final status: {}".format(sim_status))
+
+            if self._wait(self._physical_state, self.config['physical_timeout']):
+                logger.info("Physical SIM card ready!")
+                return True
+            logger.warn("Physical SIM card not ready, final status: {}".format(sim.getStatus()))
             return False
-                
+
         except Exception as e:
             logger.debug("Physical SIM card check exception: {}".format(e))
             return False
-            
+
     def start_monitoring(self):
         if not self.monitoring:
             self.monitoring = True
             self.monitor_thread = Thread(target=self._monitor_sim_status)
             self.monitor_thread.start()
             logger.info("SIM card hot-plug monitoring started")
-            
+
     def stop_monitoring(self):
         self.monitoring = False
         if self.monitor_thread:
             logger.info("Stopping SIM card monitoring...")
-            
+
     def _monitor_sim_status(self):
         while self.monitoring:
             try:
                 # Check if current SIM status is still valid
                 current_valid = self._check_current_sim_valid()
-                
+
                 if not current_valid:
-                    logger.warning("Current {} SIM connection lost, trying to reinitialize".format(self.current_sim_type))
+                    logger.warn("Current {} SIM connection lost, trying to reinitialize".format(self.current_sim_type))
                     self.is_initialized = False
-                    
+
                     # Reinitialize SIM
                     if self.initialize_sim():
                         logger.info("SIM card automatically switched to: {}".format(self.current_sim_type))
                     else:
-                        logger.warning("No available SIM card")
-                        
+                        logger.warn("No available SIM card")
+
                 utime.sleep(30)  # Check every 30 seconds
-                
+
             except Exception as e:
                 logger.error("SIM monitoring thread exception: {}".format(e))
                 utime.sleep(10)
-                
+
     def _check_current_sim_valid(self):
         try:
             if self.current_sim_type == 'vsim':
@@ -167,14 +210,15 @@ class SIMService:
                 return False
         except:
             return False
-            
+
     def get_sim_info(self):
         return {
             'type': self.current_sim_type,
             'initialized': self.is_initialized,
-            'monitoring': self.monitoring
+            'monitoring': self.monitoring,
+            'boot_metrics': self.boot_metrics,
         }
-        
+
     def force_switch_to_vsim(self):
         logger.info("Force switching to vSIM")
         if self._try_vsim():
@@ -182,9 +226,9 @@ class SIMService:
             self.is_initialized = True
             logger.info("Switched to vSIM")
             return True
-        logger.warning("vSIM switch failed")
+        logger.warn("vSIM switch failed")
         return False
-        
+
     def force_switch_to_physical(self):
         logger.info("Force switching to physical SIM card")
         if self._try_physical_sim():
@@ -192,6 +236,5 @@ class SIMService:
             self.is_initialized = True
             logger.info("Switched to physical SIM card")
             return True
-        logger.warning("Physical SIM card switch failed")
+        logger.warn("Physical SIM card switch failed")
         return False
-
@@ -1,9 +1,12 @@
 import sys
 import net
+import utime
 import sim
 import modem
 from misc import Power
 from .common import Storage
+from .threading import Thread, Event, Lock
+from .tracer import boot
 from .collections import OrderedDict, Singleton
 
 
@@ -39,6 +42,8 @@ class Application(object):
         self.config = Storage()
         self.__version = version
         self.__extensions = OrderedDict()
+        self.load_times = OrderedDict()  # extension name -> load() duration in ms, in completion order
+        self.__load_times_lock = Lock()  # written by one loader thread per extension
 
     def __repr__(self):
         return '{}(name=\"{}\", version=\"{}\")'.format(type(self).__name__, self.name, self.version)
@@ -47,7 +52,8 @@ class Application(object):
         return self.__extensions[name]
 
     def register(self, name, ext):
-        if name in self.__extensions:
+        # a lazy proxy is replaced by the service it constructed
+        if name in self.__extensions and not getattr(self.__extensions[name], 'lazy', False):
             raise ValueError('extension name \"{}\" already in use'.format(name))
         self.__extensions[name] = ext
 
@@ -72,17 +78,58 @@ class Application(object):
         ))
 
     def __loadExtensions(self):
-        for ext in self.__extensions.values():
-            if not hasattr(ext, 'load'):
-                continue
-            try:
-                ext.load()
-            except Exception as e:
-                sys.print_exception(e)
+        """Load extensions concurrently, each one once the extensions it depends on are loaded
+
+        Extensions may declare `depends`, names of extensions whose load() must finish first (names
+        not registered are ignored), and `blocking`, False lets run() return before their load() is done.
+        """
+        depends = OrderedDict()
+        for name, ext in self.__extensions.items():
+            if hasattr(ext, 'load'):
+                depends[name] = ()
+        for name in depends:
+            depends[name] = tuple(dep for dep in getattr(self.__extensions[name], 'depends', ()) if dep in depends)
+        self.__checkDepends(depends)
+        loaded = {name: Event() for name in depends}
+        for name in depends:
+            Thread(target=self.__loadExtension, args=(name, depends[name], loaded)).start()
+        for name in depends:
+            if getattr(self.__extensions[name], 'blocking', True):
+                loaded[name].wait()
+
+    @staticmethod
+    def __checkDepends(depends):
+        pending = set(depends)
+        while pending:
+            ready = [name for name in pending if not any(dep in pending for dep in depends[name])]
+            if not ready:
+                raise ValueError('circular extension dependencies: {}'.format(sorted(pending)))
+            for name in ready:
+                pending.remove(name)
+
+    def __loadExtension(self, name, depends, loaded):
+        for dep in depends:
+            loaded[dep].wait()
+        start = utime.ticks_ms()
+        boot.begin('load ' + name)
+        try:
+            self.__extensions[name].load()
+        except Exception as e:
+            sys.print_exception(e)
+        finally:
+            boot.end('load ' + name)
+            elapsed = utime.ticks_diff(utime.ticks_ms(), start)
+            with self.__load_times_lock:
+                self.load_times[name] = elapsed
+            loaded[name].set()
+        print('extension {} loaded in {} ms'.format(name, elapsed))
 
     def run(self):
         self.__powerOnPrintOnce()
-        self.__loadExtensions()
+        with boot.phase('extensions'):
+            self.__loadExtensions()
+        boot.finish()
+        print(boot.report())
 
     @property
     def version(self):
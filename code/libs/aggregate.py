@@ -0,0 +1,63 @@
+"""Windowed running statistics for sampled sensor channels
+
+Each channel keeps O(1) Welford accumulators (count, mean, M2, min, max) in
+compact typed arrays, so sampling at a high rate costs no allocation and the
+window can be emitted as min/max/mean/stddev/count at any time.
+"""
+from array import array
+
+
+INF = float('inf')
+
+
+class WindowAggregator(object):
+
+    def __init__(self, size):
+        self.size = size
+        self.__count = array('I', [0] * size)
+        self.__mean = array('f', [0.0] * size)
+        self.__m2 = array('f', [0.0] * size)
+        self.__min = array('f', [INF] * size)
+        self.__max = array('f', [-INF] * size)
+
+    def add(self, index, value):
+        count = self.__count[index] + 1
+        self.__count[index] = count
+        mean = self.__mean[index]
+        delta = value - mean
+        mean += delta / count
+        self.__mean[index] = mean
+        self.__m2[index] += delta * (value - mean)
+        if value < self.__min[index]:
+            self.__min[index] = value
+        if value > self.__max[index]:
+            self.__max[index] = value
+
+    def count(self, index):
+        return self.__count[index]
+
+    def stats(self, index):
+        """(min, max, mean, stddev, count) of the current window, None if empty"""
+        count = self.__count[index]
+        if count == 0:
+            return None
+        variance = self.__m2[index] / (count - 1) if count > 1 else 0.0
+        return self.__min[index], self.__max[index], self.__mean[index], max(variance, 0.0) ** 0.5, count
+
+    def struct(self, index, fmt=None):
+        """window stats as TSL struct {1: min, 2: max, 3: mean, 4: stddev, 5: count}"""
+        stats = self.stats(index)
+        if stats is None:
+            return None
+        if fmt is None:
+            return {1: stats[0], 2: stats[1], 3: stats[2], 4: stats[3], 5: stats[4]}
+        return {1: fmt(stats[0]), 2: fmt(stats[1]), 3: fmt(stats[2]), 4: fmt(stats[3]), 5: stats[4]}
+
+    def reset(self, index=None):
+        indexes = range(self.size) if index is None else (index,)
+        for i in indexes:
+            self.__count[i] = 0
+            self.__mean[i] = 0.0
+            self.__m2[i] = 0.0
+            self.__min[i] = INF
+            self.__max[i] = -INF
@@ -0,0 +1,134 @@
+"""Deadband/hysteresis change detection for telemetry reporting
+
+Every property keeps two baselines: the last sampled value and the last value
+actually delivered. Decisions are made against the delivered one, so a failed
+send only re-reports the properties that still differ instead of everything.
+
+Per-property rule options (all optional):
+    deadband      absolute change needed to report
+    relative      change needed as a fraction of the last sent value
+    hysteresis    extra change needed when the value reverses direction
+    min_interval  seconds to hold off after a report (rate limit)
+    max_interval  seconds after which the value is re-reported anyway (heartbeat), 0 disables
+
+Vector values (xyz lists) use the L1 norm of the change.
+"""
+import utime
+
+
+class Rule(object):
+
+    def __init__(self, deadband=0, relative=0, hysteresis=0, min_interval=0, max_interval=0):
+        self.deadband = deadband
+        self.relative = relative
+        self.hysteresis = hysteresis
+        self.min_interval = min_interval * 1000
+        self.max_interval = max_interval * 1000
+
+    def __repr__(self):
+        return '{}(deadband={}, relative={}, hysteresis={}, min_interval={}, max_interval={})'.format(
+            type(self).__name__, self.deadband, self.relative, self.hysteresis,
+            self.min_interval // 1000, self.max_interval // 1000
+        )
+
+
+def _delta(a, b):
+    if isinstance(a, (list, tuple)):
+        return [x - y for x, y in zip(a, b)]
+    return a - b
+
+
+def _norm(value):
+    if isinstance(value, (list, tuple)):
+        return sum(abs(x) for x in value)
+    return abs(value)
+
+
+def _dot(a, b):
+    if isinstance(a, (list, tuple)):
+        return sum(x * y for x, y in zip(a, b))
+    return a * b
+
+
+class ChangeDetector(object):
+    SENT = 0
+    SENT_AT = 1
+    DIRECTION = 2
+    SAMPLED = 3
+
+    def __init__(self, rules=None, default=None):
+        self.__default = default or Rule()
+        self.__rules = rules or {}
+        self.__states = {}  # key -> [last sent, sent at (ms), last change, last sampled]
+
+    @classmethod
+    def fromConfig(cls, config):
+        """build from a `{"default": {...}, "<key>": {...}}` mapping, numeric keys become ints"""
+        config = config or {}
+        default = config.get('default', {})
+        rules = {}
+        for key, options in config.items():
+            if key == 'default':
+                continue
+            merged = dict(default)
+            merged.update(options)
+            rules[int(key) if key.isdigit() else key] = Rule(**merged)
+        return cls(rules, Rule(**default))
+
+    def rule(self, key):
+        return self.__rules.get(key, self.__default)
+
+    def sample(self, key, value, now=None):
+        """record a sampled value, return True if it should be reported"""
+        if now is None:
+            now = utime.ticks_ms()
+        state = self.__states.get(key)
+        if state is None:
+            state = self.__states[key] = [None, now, None, value]
+        else:
+            state[self.SAMPLED] = value
+        sent = state[self.SENT]
+        if sent is None:
+            return True
+
+        rule = self.rule(key)
+        elapsed = utime.ticks_diff(now, state[self.SENT_AT])
+        if elapsed < rule.min_interval:
+            return False
+        if rule.max_interval and elapsed >= rule.max_interval:
+            return True
+
+        delta = _delta(value, sent)
+        threshold = max(rule.deadband, rule.relative * _norm(sent))
+        direction = state[self.DIRECTION]
+        if rule.hysteresis and direction is not None and _dot(delta, direction) < 0:
+            threshold += rule.hysteresis
+        return _norm(delta) > threshold
+
+    def sent(self, keys, now=None):
+        """commit the last sampled values of `keys` as delivered"""
+        if now is None:
+            now = utime.ticks_ms()
+        for key in keys:
+            state = self.__states.get(key)
+            if state is None:
+                continue
+            if state[self.SENT] is not None:
+                state[self.DIRECTION] = _delta(state[self.SAMPLED], state[self.SENT])
+            state[self.SENT] = state[self.SAMPLED]
+            state[self.SENT_AT] = now
+
+    def last_sent(self, key):
+        state = self.__states.get(key)
+        return None if state is None else state[self.SENT]
+
+    def last_sampled(self, key):
+        state = self.__states.get(key)
+        return None if state is None else state[self.SAMPLED]
+
+    def reset(self, key=None):
+        """forget baselines so the next sample is reported, all keys if `key` is None"""
+        if key is None:
+            self.__states.clear()
+        else:
+            self.__states.pop(key, None)
@@ -0,0 +1,98 @@
+"""Compact binary telemetry frames for Qth passthrough (sendTrans)
+
+Frame layout, big-endian, version 1:
+
+    header   magic "SK" | version u8 | type u8 | channels u8 | samples u16 | t0 u32 | interval_ms u16
+    channel  id u8 | scale u16 | first value i32            (repeated `channels` times)
+    body     delta i16                                      (channels x (samples - 1), sample-major)
+
+Values are fixed-point integers (real value = integer / scale). A delta that
+does not fit in i16 is written as the escape 0x8000 followed by the absolute
+value as i32. The buffer is preallocated for the worst case, so encoding never
+allocates. `tools/telemetry_decoder.py` decodes frames on the host.
+"""
+import ustruct as struct
+
+
+MAGIC = b'SK'
+VERSION = 1
+
+# frame types
+SAMPLES = 1
+TRACK = 2
+
+HEADER_FORMAT = '>2sBBBHIH'
+HEADER_SIZE = 13
+CHANNEL_FORMAT = '>BHi'
+CHANNEL_SIZE = 7
+DELTA_ESCAPE = -0x8000
+
+
+class FrameEncoder(object):
+
+    def __init__(self, channels, capacity, frame_type=SAMPLES):
+        """
+        :param channels: list of (channel id, scale)
+        :param capacity: max samples per frame
+        :param frame_type: SAMPLES or TRACK
+        """
+        if not 0 < len(channels) < 256:
+            raise ValueError('channels count must be in [1, 255]')
+        if not 0 < capacity < 0x10000:
+            raise ValueError('capacity must be in [1, 65535]')
+        self.channels = channels
+        self.capacity = capacity
+        self.frame_type = frame_type
+        self.__body_offset = HEADER_SIZE + CHANNEL_SIZE * len(channels)
+        # worst case every delta escaped: 2 bytes escape + 4 bytes value
+        self.__buf = bytearray(self.__body_offset + 6 * len(channels) * (capacity - 1))
+        self.__first = [0] * len(channels)
+        self.__prev = [0] * len(channels)
+        self.__count = 0
+        self.__offset = self.__body_offset
+
+    @property
+    def count(self):
+        return self.__count
+
+    def full(self):
+        return self.__count >= self.capacity
+
+    def reset(self):
+        self.__count = 0
+        self.__offset = self.__body_offset
+
+    def add(self, values):
+        """append one sample of scaled integers (one per channel), False if the frame is full"""
+        if self.__count >= self.capacity:
+            return False
+        buf = self.__buf
+        prev = self.__prev
+        if self.__count == 0:
+            for i, value in enumerate(values):
+                self.__first[i] = value
+                prev[i] = value
+        else:
+            offset = self.__offset
+            for i, value in enumerate(values):
+                delta = value - prev[i]
+                if DELTA_ESCAPE < delta < 0x8000:
+                    struct.pack_into('>h', buf, offset, delta)
+                    offset += 2
+                else:
+                    struct.pack_into('>hi', buf, offset, DELTA_ESCAPE, value)
+                    offset += 6
+                prev[i] = value
+            self.__offset = offset
+        self.__count += 1
+        return True
+
+    def encode(self, t0, interval_ms):
+        """finish the frame, return a memoryview over the encoded bytes (valid until the next add/reset)"""
+        buf = self.__buf
+        struct.pack_into(HEADER_FORMAT, buf, 0, MAGIC, VERSION, self.frame_type, len(self.channels), self.__count, t0, interval_ms)
+        offset = HEADER_SIZE
+        for i, (channel_id, scale) in enumerate(self.channels):
+            struct.pack_into(CHANNEL_FORMAT, buf, offset, channel_id, scale, self.__first[i])
+            offset += CHANNEL_SIZE
+        return memoryview(buf)[:self.__offset]
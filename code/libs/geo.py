@@ -0,0 +1,95 @@
+"""Geodesic helpers shared by GNSS reporting, track simplification, odometry and geofencing
+
+Two distance paths are provided:
+
+* `haversine`: great-circle distance, accurate for any separation (spherical
+  earth, ~0.5% vs. WGS84).
+* `Origin.distance`: equirectangular approximation around a fixed origin with
+  cos(latitude) computed once. Used while the point is within FAST_LAT_DELTA
+  (0.01 degree, ~1.1 km) and FAST_LNG_DELTA of the origin, where the error relative to haversine
+  is bounded by about tan(lat) * dlat: < 3e-4 of the distance up to 60 degree
+  latitude, i.e. ~1.5 cm on a 50 m movement. Beyond that it falls back to
+  haversine.
+
+Firmware without `math` gets sin/cos from `cmath` and a series based asin.
+"""
+try:
+    from math import sin, cos, asin, radians, pi
+except ImportError:
+    from cmath import sin as _csin, cos as _ccos, pi
+
+    def radians(x):
+        return x * pi / 180.0
+
+    def sin(x):
+        return _csin(x).real
+
+    def cos(x):
+        return _ccos(x).real
+
+    def asin(x):
+        return asin_series(x)
+
+
+EARTH_RADIUS = 6371.0  # km, mean radius
+KM_PER_DEGREE = EARTH_RADIUS * pi / 180.0
+FAST_LAT_DELTA = 0.01  # degree
+FAST_LNG_DELTA = 0.05  # degree
+
+
+def asin_series(x):
+    """arcsin by Taylor series, |error| < 1e-11 for |x| <= 1
+
+    The argument is first reduced with asin(x) = 2 * asin(x / sqrt(2 * (1 + sqrt(1 - x²))))
+    until |x| < 0.1, where five terms of x + x³/6 + 3x⁵/40 + 5x⁷/112 + 35x⁹/1152 suffice.
+    """
+    if x > 1.0 or x < -1.0:
+        raise ValueError('math domain error')
+    factor = 1
+    while x > 0.1 or x < -0.1:
+        x = x / (2 * (1 + (1 - x * x) ** 0.5)) ** 0.5
+        factor *= 2
+    x2 = x * x
+    return factor * x * (1 + x2 * (1 / 6.0 + x2 * (3 / 40.0 + x2 * (5 / 112.0 + x2 * 35 / 1152.0))))
+
+
+def haversine(lat0, lng0, lat1, lng1):
+    """great-circle distance in km"""
+    lat0 = radians(lat0)
+    lat1 = radians(lat1)
+    s_dlat = sin((lat1 - lat0) / 2)
+    s_dlng = sin(radians(lng1 - lng0) / 2)
+    h = s_dlat * s_dlat + cos(lat0) * cos(lat1) * s_dlng * s_dlng
+    return 2 * EARTH_RADIUS * asin(min(h, 1.0) ** 0.5)
+
+
+def equirectangular(lat0, lng0, lat1, lng1):
+    """fast approximate distance in km, for short separations"""
+    x = (lng1 - lng0) * cos(radians((lat0 + lat1) / 2))
+    y = lat1 - lat0
+    return KM_PER_DEGREE * (x * x + y * y) ** 0.5
+
+
+class Origin(object):
+    """reference point with cached cos(latitude) for repeated short distance checks"""
+
+    def __init__(self, lat, lng):
+        self.lat = lat
+        self.lng = lng
+        self.cos_lat = cos(radians(lat))
+
+    def __repr__(self):
+        return '{}(lat={}, lng={})'.format(type(self).__name__, self.lat, self.lng)
+
+    def project(self, lat, lng):
+        """local (east, north) offset in meters"""
+        return (lng - self.lng) * self.cos_lat * KM_PER_DEGREE * 1000, (lat - self.lat) * KM_PER_DEGREE * 1000
+
+    def distance(self, lat, lng):
+        """distance in km, equirectangular when close, haversine otherwise"""
+        dlat = lat - self.lat
+        dlng = lng - self.lng
+        if -FAST_LAT_DELTA < dlat < FAST_LAT_DELTA and -FAST_LNG_DELTA < dlng < FAST_LNG_DELTA:
+            x = dlng * self.cos_lat
+            return KM_PER_DEGREE * (x * x + dlat * dlat) ** 0.5
+        return haversine(self.lat, self.lng, lat, lng)
@@ -0,0 +1,129 @@
+"""Circle/polygon geofences with a grid index
+
+Fences are bucketed by bounding box into a lat/lng grid, so evaluating a fix
+only tests the fences registered in its cell: a dict lookup, a bounding box
+check, then the exact circle or point-in-polygon test on the few candidates.
+
+Definition file (json):
+    {
+        "cell_size": 0.01,
+        "fences": [
+            {"id": 1, "type": "circle", "center": [lat, lng], "radius": 200},
+            {"id": 2, "type": "polygon", "points": [[lat, lng], [lat, lng], [lat, lng]]}
+        ]
+    }
+radius is in meters, cell_size in degrees.
+
+A transition is only reported once `dwell` consecutive fixes agree on it, so
+position jitter at a fence edge does not produce enter/exit pairs.
+"""
+import ql_fs
+from .geo import Origin, KM_PER_DEGREE
+
+
+ENTER = 1
+EXIT = 2
+
+
+class Circle(object):
+
+    def __init__(self, fence_id, center, radius):
+        self.id = fence_id
+        self.origin = Origin(center[0], center[1])
+        self.radius = radius / 1000.0  # km
+        dlat = self.radius / KM_PER_DEGREE
+        dlng = dlat / max(self.origin.cos_lat, 1e-6)
+        self.bbox = (center[0] - dlat, center[1] - dlng, center[0] + dlat, center[1] + dlng)
+
+    def contains(self, lat, lng):
+        return self.origin.distance(lat, lng) <= self.radius
+
+
+class Polygon(object):
+
+    def __init__(self, fence_id, points):
+        if len(points) < 3:
+            raise ValueError('polygon fence {} needs at least 3 points'.format(fence_id))
+        self.id = fence_id
+        self.lats = [p[0] for p in points]
+        self.lngs = [p[1] for p in points]
+        self.bbox = (min(self.lats), min(self.lngs), max(self.lats), max(self.lngs))
+
+    def contains(self, lat, lng):
+        # even-odd ray casting along the latitude axis
+        lats = self.lats
+        lngs = self.lngs
+        inside = False
+        j = len(lats) - 1
+        for i in range(len(lats)):
+            if (lats[i] > lat) != (lats[j] > lat):
+                if lng < (lngs[j] - lngs[i]) * (lat - lats[i]) / (lats[j] - lats[i]) + lngs[i]:
+                    inside = not inside
+            j = i
+        return inside
+
+
+class Geofence(object):
+
+    def __init__(self, fences=(), cell_size=0.01, dwell=2):
+        self.cell_size = cell_size
+        self.dwell = dwell
+        self.fences = []
+        self.__grid = {}  # (row, col) -> tuple of fences
+        self.__inside = set()  # ids of fences the device is confirmed inside
+        self.__pending = {}  # fence id -> consecutive fixes contradicting __inside
+        for fence in fences:
+            self.add(fence)
+
+    @classmethod
+    def load(cls, path, dwell=2):
+        data = ql_fs.read_json(path)
+        fences = []
+        for item in data.get('fences', []):
+            if item['type'] == 'circle':
+                fences.append(Circle(item['id'], item['center'], item['radius']))
+            elif item['type'] == 'polygon':
+                fences.append(Polygon(item['id'], item['points']))
+            else:
+                raise ValueError('unknown fence type \"{}\"'.format(item['type']))
+        return cls(fences, data.get('cell_size', 0.01), dwell)
+
+    def __cell(self, lat, lng):
+        return int(lat // self.cell_size), int(lng // self.cell_size)
+
+    def add(self, fence):
+        self.fences.append(fence)
+        row0, col0 = self.__cell(fence.bbox[0], fence.bbox[1])
+        row1, col1 = self.__cell(fence.bbox[2], fence.bbox[3])
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                self.__grid[(row, col)] = self.__grid.get((row, col), ()) + (fence,)
+
+    def __len__(self):
+        return len(self.fences)
+
+    def inside(self):
+        return set(self.__inside)
+
+    def evaluate(self, lat, lng):
+        """test a fix, return the list of (fence id, ENTER/EXIT) transitions"""
+        current = set()
+        for fence in self.__grid.get(self.__cell(lat, lng), ()):
+            bbox = fence.bbox
+            if bbox[0] <= lat <= bbox[2] and bbox[1] <= lng <= bbox[3] and fence.contains(lat, lng):
+                current.add(fence.id)
+        events = []
+        changed = current ^ self.__inside
+        pending = {}
+        for fence_id in changed:
+            count = self.__pending.get(fence_id, 0) + 1
+            if count < self.dwell:
+                pending[fence_id] = count
+            elif fence_id in current:
+                self.__inside.add(fence_id)
+                events.append((fence_id, ENTER))
+            else:
+                self.__inside.discard(fence_id)
+                events.append((fence_id, EXIT))
+        self.__pending = pending  # a fix agreeing with the confirmed state resets the count
+        return events
@@ -0,0 +1,49 @@
+"""Persisted last good GNSS fix for warm starts
+
+The last valid position and its time are written to flash at most every
+`save_interval` seconds while positioning. On the next boot the cached data
+is handed to whatever assistance hooks the GNSS firmware offers, so the
+receiver does not have to start from scratch.
+"""
+import utime
+from .common import Storage
+
+
+class FixCache(object):
+
+    def __init__(self, path, save_interval=600, max_age=4 * 3600):
+        """
+        :param path: json file holding the cached fix
+        :param save_interval: seconds between flash writes while positioning
+        :param max_age: seconds after which a cached fix is too old for a warm start
+        """
+        self.save_interval = save_interval
+        self.max_age = max_age
+        self.__storage = Storage()
+        self.__storage.init(path)
+        self.__saved_at = None
+
+    def get(self, now=None):
+        """cached fix dict (lat, lng, altitude, time) if recent enough, else None"""
+        cached = self.__storage.get('fix')
+        if not cached:
+            return None
+        if now is None:
+            now = utime.time()
+        age = now - cached['time']
+        # a negative age means the RTC is not synced yet, the fix age is unknown
+        if age < 0 or age > self.max_age:
+            return None
+        return cached
+
+    def update(self, fix, now=None):
+        """remember a valid fix, write it to flash when due, return True if written"""
+        if now is None:
+            now = utime.time()
+        if self.__saved_at is not None and now - self.__saved_at < self.save_interval:
+            return False
+        with self.__storage:
+            self.__storage['fix'] = {'lat': fix.lat, 'lng': fix.lng, 'altitude': fix.altitude, 'time': now}
+            self.__storage.save()
+        self.__saved_at = now
+        return True
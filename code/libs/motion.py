@@ -0,0 +1,75 @@
+"""Stationary/moving detection from accelerometer samples
+
+The variance of the acceleration magnitude is evaluated over fixed time
+windows: a window whose stddev exceeds `threshold` marks motion, and a single
+sample deviating from the last window mean by more than `wake_threshold` marks
+motion immediately. The device is stationary once no motion was seen for
+`hold` seconds. Without fresh samples (sensor unplugged) the state is unknown
+and reported as not stationary, so consumers fail safe. Samples may be fed
+from several threads.
+"""
+import utime
+from .aggregate import WindowAggregator
+from .threading import Event, Lock
+
+
+class MotionDetector(object):
+
+    def __init__(self, threshold=0.05, wake_threshold=0.5, window=5, hold=60):
+        """
+        :param threshold: accel magnitude stddev (m/s²) above which a window counts as motion
+        :param wake_threshold: single-sample deviation (m/s²) from the last window mean that counts as motion
+        :param window: evaluation window, seconds
+        :param hold: seconds without motion before the device is stationary
+        """
+        self.threshold = threshold
+        self.wake_threshold = wake_threshold
+        self.window = window * 1000
+        self.hold = hold * 1000
+        self.__stats = WindowAggregator(1)
+        self.__window_start = utime.ticks_ms()
+        self.__last_motion = self.__window_start
+        self.__last_sample = None
+        self.__reference = None  # mean of the last window
+        self.__moved = Event()
+        self.__lock = Lock()  # the window statistics are not thread safe
+
+    @classmethod
+    def fromConfig(cls, config):
+        return cls(**(config or {}))
+
+    def add(self, accel, now=None):
+        """feed an (x, y, z) acceleration sample in m/s²"""
+        if now is None:
+            now = utime.ticks_ms()
+        magnitude = (accel[0] * accel[0] + accel[1] * accel[1] + accel[2] * accel[2]) ** 0.5
+        with self.__lock:
+            self.__last_sample = now
+            if self.__reference is not None and abs(magnitude - self.__reference) > self.wake_threshold:
+                self.__motion(now)
+            stats = self.__stats
+            stats.add(0, magnitude)
+            if utime.ticks_diff(now, self.__window_start) >= self.window and stats.count(0) > 1:
+                _, _, mean, stddev, _ = stats.stats(0)
+                if stddev > self.threshold:
+                    self.__motion(now)
+                self.__reference = mean
+                stats.reset()
+                self.__window_start = now
+
+    def __motion(self, now):
+        self.__last_motion = now
+        self.__moved.set()
+
+    def stationary(self, hold=None, now=None):
+        if now is None:
+            now = utime.ticks_ms()
+        hold = self.hold if hold is None else hold * 1000
+        if self.__last_sample is None or utime.ticks_diff(now, self.__last_sample) > max(hold, self.window * 2):
+            return False  # no fresh data, unknown
+        return utime.ticks_diff(now, self.__last_motion) >= hold
+
+    def wait_motion(self, timeout=None):
+        """block until motion is detected after this call, return False on timeout"""
+        self.__moved.clear()
+        return self.__moved.wait(timeout=timeout, clear=True)
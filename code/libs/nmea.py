@@ -0,0 +1,144 @@
+"""Incremental NMEA 0183 parser
+
+Raw GNSS reads are fed as they arrive. An incomplete trailing sentence is
+carried over to the next read, so nothing is lost at read boundaries.
+Sentences are filtered by type from their header before the checksum is
+computed, and the wanted fields are decoded straight into a GnssFix record.
+"""
+
+
+RMC = 'RMC'
+GGA = 'GGA'
+KNOT_TO_KMH = 1.852
+
+
+class GnssFix(object):
+    """latest position merged from RMC/GGA sentences"""
+
+    def __init__(self):
+        self.valid = False
+        self.lat = 0.0  # degree, south negative
+        self.lng = 0.0  # degree, west negative
+        self.speed = 0.0  # km/h (RMC)
+        self.course = 0.0  # degree (RMC)
+        self.hdop = 99.9  # (GGA)
+        self.satellites = 0  # (GGA)
+        self.altitude = 0.0  # m (GGA)
+        self.utc = ''  # hhmmss.ss
+        self.date = ''  # ddmmyy (RMC)
+        self.sentence = ''  # raw sentence of the last valid position, RMC preferred
+        self.source = ''  # RMC or GGA
+        self.seq = 0  # bumped on every valid position
+
+    def __repr__(self):
+        return '{}(valid={}, lat={}, lng={}, speed={}, hdop={}, satellites={})'.format(
+            type(self).__name__, self.valid, self.lat, self.lng, self.speed, self.hdop, self.satellites
+        )
+
+
+def _degree(value, hemisphere, width):
+    # NMEA "dddmm.mmmm" -> signed decimal degree
+    degree = int(value[:width]) + float(value[width:]) / 60
+    return -degree if hemisphere in ('S', 'W') else degree
+
+
+def _float(value, default=0.0):
+    return float(value) if value else default
+
+
+def checksum(data, start, end):
+    crc = 0
+    for i in range(start, end):
+        crc ^= ord(data[i])
+    return crc
+
+
+class NmeaParser(object):
+    MAX_CARRY = 256  # a sentence is at most 82 chars, anything longer is garbage
+
+    def __init__(self, types=(RMC, GGA)):
+        self.types = types
+        self.fix = GnssFix()
+        self.__carry = ''
+        self.errors = 0
+
+    def reset(self):
+        self.__carry = ''
+        self.fix = GnssFix()
+
+    def feed(self, data):
+        """parse a chunk of raw NMEA text, return the number of valid positions decoded"""
+        if isinstance(data, (bytes, bytearray)):
+            data = data.decode()
+        if self.__carry:
+            data = self.__carry + data
+        updated = 0
+        start = 0
+        while True:
+            end = data.find('\n', start)
+            if end == -1:
+                break
+            if self.__parse(data, start, end):
+                updated += 1
+            start = end + 1
+        tail = len(data) - start
+        self.__carry = data[start:] if 0 < tail <= self.MAX_CARRY else ''
+        return updated
+
+    def __parse(self, data, start, end):
+        head = data.find('$', start, end)
+        # "$" + 2 chars talker id + 3 chars sentence type
+        if head == -1 or data[head + 3:head + 6] not in self.types:
+            return False
+        star = data.find('*', head, end)
+        if star == -1 or end - star < 3:
+            return False
+        try:
+            if checksum(data, head + 1, star) != int(data[star + 1:star + 3], 16):
+                self.errors += 1
+                return False
+            fields = data[head:star].split(',')
+            if fields[0][3:] == RMC:
+                return self.__rmc(fields, data[head:star + 3])
+            return self.__gga(fields, data[head:star + 3])
+        except (ValueError, IndexError):
+            self.errors += 1
+            return False
+
+    def __rmc(self, fields, sentence):
+        fix = self.fix
+        fix.utc = fields[1]
+        if fields[2] != 'A':
+            fix.valid = False
+            return False
+        fix.lat = _degree(fields[3], fields[4], 2)
+        fix.lng = _degree(fields[5], fields[6], 3)
+        fix.speed = _float(fields[7]) * KNOT_TO_KMH
+        fix.course = _float(fields[8])
+        fix.date = fields[9]
+        fix.sentence = sentence
+        fix.source = RMC
+        fix.valid = True
+        fix.seq += 1
+        return True
+
+    def __gga(self, fields, sentence):
+        fix = self.fix
+        same_epoch_rmc = fix.valid and fix.source == RMC and fix.utc == fields[1]
+        fix.utc = fields[1]
+        fix.satellites = int(fields[7] or 0)
+        fix.hdop = _float(fields[8], 99.9)
+        if fields[6] in ('', '0'):
+            fix.valid = False
+            return False
+        fix.altitude = _float(fields[9])
+        if same_epoch_rmc:
+            # position already taken from the RMC sentence of this epoch
+            return False
+        fix.lat = _degree(fields[2], fields[3], 2)
+        fix.lng = _degree(fields[4], fields[5], 3)
+        fix.sentence = sentence
+        fix.source = GGA
+        fix.valid = True
+        fix.seq += 1
+        return True
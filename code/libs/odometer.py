@@ -0,0 +1,83 @@
+"""Running odometer integrated over every valid GNSS fix
+
+Distance is accumulated between consecutive accepted fixes. Fixes are
+rejected as jitter when HDOP is poor or the receiver reports standstill, and
+jumps implying an impossible speed restart the integration instead of being
+counted. The total is persisted with write coalescing: flash is written only
+once `save_distance` km were added or `save_interval` seconds passed since
+the last write with unsaved distance.
+"""
+import utime
+from .common import Storage
+from .geo import Origin
+
+
+class Odometer(object):
+
+    def __init__(self, path, max_hdop=5.0, min_speed=3.0, max_speed=300.0, save_interval=300, save_distance=1.0):
+        """
+        :param path: json file holding the persisted total
+        :param max_hdop: fixes with a worse HDOP are ignored
+        :param min_speed: km/h below which the receiver is considered standing still
+        :param max_speed: km/h above which a step is treated as a position jump
+        :param save_interval: seconds, max age of unsaved distance
+        :param save_distance: km of unsaved distance that forces a write
+        """
+        self.max_hdop = max_hdop
+        self.min_speed = min_speed
+        self.max_speed = max_speed
+        self.save_interval = save_interval
+        self.save_distance = save_distance
+        self.__storage = Storage()
+        self.__storage.init(path)
+        self.__total = self.__storage.get('total', 0.0)  # km
+        self.__saved = self.__total
+        self.__saved_at = utime.time()
+        self.__anchor = None  # Origin of the last accepted fix
+        self.__anchor_at = None
+
+    @property
+    def total(self):
+        return self.__total
+
+    def update(self, lat, lng, speed=None, hdop=None, now=None):
+        """integrate a valid fix, return the distance added in km"""
+        if now is None:
+            now = utime.time()
+        if hdop is not None and hdop > self.max_hdop:
+            return 0.0
+        if self.__anchor is None:
+            self.__anchor, self.__anchor_at = Origin(lat, lng), now
+            return 0.0
+        if speed is not None and speed < self.min_speed:
+            return 0.0  # standstill, keep the anchor so jitter is not integrated
+        distance = self.__anchor.distance(lat, lng)
+        elapsed = now - self.__anchor_at
+        self.__anchor, self.__anchor_at = Origin(lat, lng), now
+        if elapsed > 0 and distance / elapsed * 3600 > self.max_speed:
+            return 0.0  # position jump, restart from here
+        self.__total += distance
+        return distance
+
+    def save(self, force=False, now=None):
+        """persist the total if coalescing rules allow, return True if written"""
+        if now is None:
+            now = utime.time()
+        unsaved = self.__total - self.__saved
+        if unsaved <= 0:
+            return False
+        if not force and unsaved < self.save_distance and now - self.__saved_at < self.save_interval:
+            return False
+        self.__write(now)
+        return True
+
+    def __write(self, now):
+        with self.__storage:
+            self.__storage['total'] = self.__total
+            self.__storage.save()
+        self.__saved = self.__total
+        self.__saved_at = now
+
+    def reset(self, total=0.0):
+        self.__total = total
+        self.__write(utime.time())
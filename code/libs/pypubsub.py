@@ -1,57 +1,294 @@
-"""基于 QuecPython 的订阅/发布机制"""
+"""基于 QuecPython 的订阅/发布机制
 
+Messages are delivered by `workers` threads, each with its own queue. Topics are
+sharded by hash, so the messages of one topic keep their order while a slow
+listener only delays the topics sharing its worker. With `stats=True` the
+publisher keeps per-topic queue depth and dispatch latency, see `stats()`.
 
+Topics are "/" separated levels. Subscriptions may use MQTT style wildcards:
+`+` matches exactly one level, a trailing `#` matches any number of levels,
+including none ("sensor/#" gets "sensor" and "sensor/accel/x"). Wildcard
+subscriptions live in a topic trie, resolved in O(depth) per concrete topic and
+cached until the next subscribe/unsubscribe. Without wildcard subscriptions a
+publish costs a single dict lookup.
+
+When a worker queue is full, `set_policy(topic, ...)` decides what a publish on
+that topic does: BLOCK waits (default), DROP_NEWEST discards the new message,
+DROP_OLDEST evicts the oldest queued message of the topic. COALESCE always
+replaces a queued message of the topic with the same `key` value (any queued
+message of the topic without a key) and otherwise behaves like DROP_OLDEST.
+Drops and merges are counted per topic, see `counters()`.
+
+Topics set to SYNC skip the queue: listeners run right away in the publisher's
+thread, with no queue handoff, thread wakeup or lock. Meant for latency critical
+topics with quick listeners, a slow one stalls the publisher.
+"""
+
+import utime
 from usr.libs.threading import Thread, Queue, Lock
 
 
+SEPARATOR = '/'
+SINGLE_LEVEL = '+'
+MULTI_LEVEL = '#'
+MAX_RESOLVED = 64  # cached concrete topics while wildcard subscriptions exist
+
+# overflow policies
+BLOCK = 'block'
+DROP_NEWEST = 'drop_newest'
+DROP_OLDEST = 'drop_oldest'
+COALESCE = 'coalesce'
+SYNC = 'sync'  # not queued at all
+POLICIES = (BLOCK, DROP_NEWEST, DROP_OLDEST, COALESCE, SYNC)
+
+
+def _is_pattern(topic):
+    return SINGLE_LEVEL in topic or MULTI_LEVEL in topic
+
+
+def _levels(pattern):
+    levels = pattern.split(SEPARATOR)
+    for index, level in enumerate(levels):
+        if (SINGLE_LEVEL in level and level != SINGLE_LEVEL) or \
+                (MULTI_LEVEL in level and (level != MULTI_LEVEL or index != len(levels) - 1)):
+            raise ValueError('invalid topic pattern \"{}\"'.format(pattern))
+    return levels
+
+
 class Publisher(object):
     
-    def __init__(self):
-        self.__q = Queue()
+    def __init__(self, workers=1, stats=False, max_size=100):
+        if workers <= 0:
+            raise ValueError('workers must be greater than 0.')
+        self.__queues = tuple(Queue(max_size) for _ in range(workers))
+        self.__policies = {}  # topic -> (policy, coalesce key)
+        self.__counters = {}  # topic -> [dropped, coalesced]
+        # topic -> tuple of listeners. Tuples are never mutated, subscribe/unsubscribe swap in a new one
+        # under the lock, so dispatch reads a consistent snapshot without locking
         self.__topic_manager_lock = Lock()
         self.__topic_manager = {}
-        self.__listen_thread = Thread(target=self.__listen_worker)
+        # wildcard subscriptions: trie of [children {level: node}, listeners tuple] nodes
+        self.__trie = [{}, ()]
+        self.__patterns = 0
+        self.__resolved = {}  # concrete topic -> exact plus wildcard listeners, replaced on any change
+        self.__listen_threads = tuple(Thread(target=self.__listen_worker, args=(q,)) for q in self.__queues)
+        # topic -> [pending, dispatched, total latency us, max latency us]
+        self.__stats = {} if stats else None
+        self.__stats_lock = Lock()
     
     def listen(self):
-        self.__listen_thread.start()
+        for thread in self.__listen_threads:
+            thread.start()
 
-    def __listen_worker(self):
+    def __listen_worker(self, q):
         while True:
-            topic, messages = self.__q.get()
+            topic, messages, queued_at = q.get()
             # print("topic: {}, messages: {}".format(topic, messages))
-            with self.__topic_manager_lock:
-                for listener in self.__topic_manager.setdefault(topic, []):
-                    try:
-                        listener(**messages)
-                    except Exception as e:
-                        print("listener error:", str(e))
+            if queued_at is not None:
+                self.__record(topic, queued_at)
+            self.__dispatch(topic, messages)
+
+    def __record(self, topic, queued_at):
+        latency = utime.ticks_diff(utime.ticks_us(), queued_at)
+        with self.__stats_lock:
+            entry = self.__stats[topic]
+            entry[0] -= 1
+            entry[1] += 1
+            entry[2] += latency
+            if latency > entry[3]:
+                entry[3] = latency
+
+    def __listeners(self, topic):
+        if not self.__patterns:
+            return self.__topic_manager.get(topic)
+        resolved = self.__resolved  # keep the dict this lookup belongs to, it is swapped on invalidation
+        listeners = resolved.get(topic)
+        if listeners is None:
+            matches = list(self.__topic_manager.get(topic, ()))
+            self.__match(self.__trie, topic.split(SEPARATOR), 0, matches)
+            listeners = tuple(matches)
+            if len(resolved) >= MAX_RESOLVED:
+                resolved.clear()
+            resolved[topic] = listeners
+        return listeners
+
+    def __match(self, node, levels, index, matches):
+        children = node[0]
+        child = children.get(MULTI_LEVEL)
+        if child is not None:
+            matches.extend(child[1])
+        if index == len(levels):
+            matches.extend(node[1])
+            return
+        for key in (levels[index], SINGLE_LEVEL):
+            child = children.get(key)
+            if child is not None:
+                self.__match(child, levels, index + 1, matches)
+
+    def __dispatch(self, topic, messages):
+        listeners = self.__listeners(topic)
+        if not listeners:
+            return
+        for listener in listeners:
+            try:
+                listener(**messages)
+            except Exception as e:
+                print("listener error:", str(e))
+
+    def __queue(self, topic):
+        queues = self.__queues
+        if len(queues) == 1:
+            return queues[0]
+        return queues[hash(topic) % len(queues)]
+
+    def set_policy(self, topic, policy, key=None):
+        """overflow policy of a concrete topic or SYNC delivery, see module doc"""
+        if policy not in POLICIES:
+            raise ValueError('unknown overflow policy \"{}\"'.format(policy))
+        if _is_pattern(topic):
+            raise ValueError('overflow policy needs a concrete topic, got \"{}\"'.format(topic))
+        self.__policies[topic] = (policy, key)
+
+    def __pending(self, topic, delta):
+        with self.__stats_lock:
+            entry = self.__stats.get(topic)
+            if entry is None:
+                entry = self.__stats[topic] = [0, 0, 0, 0]
+            entry[0] += delta
+
+    def __count(self, topic, index):
+        with self.__stats_lock:
+            entry = self.__counters.get(topic)
+            if entry is None:
+                entry = self.__counters[topic] = [0, 0]
+            entry[index] += 1
 
     def publish(self, topic, **kwargs):
-        self.__q.put((topic, kwargs))
+        policy = self.__policies.get(topic)
+        if policy is not None and policy[0] == SYNC:
+            self.__dispatch(topic, kwargs)
+            return
+        q = self.__queue(topic)
+        if policy is None or policy[0] == BLOCK:
+            if self.__stats is None:
+                q.put((topic, kwargs, None))
+            else:
+                self.__pending(topic, 1)
+                q.put((topic, kwargs, utime.ticks_us()))
+            return
+        mode, key = policy
+        if mode == COALESCE:
+            value = kwargs.get(key)
+
+            def merge(queued):
+                if queued[0] == topic and (key is None or queued[1].get(key) == value):
+                    return topic, kwargs, queued[2]
+
+            if q.replace(merge):
+                self.__count(topic, 1)
+                return
+        if self.__stats is None:
+            item = (topic, kwargs, None)
+        else:
+            self.__pending(topic, 1)
+            item = (topic, kwargs, utime.ticks_us())
+        try:
+            if mode == DROP_NEWEST:
+                q.put(item, block=False)
+                return
+            evicted = q.evict(item, lambda queued: queued[0] == topic)
+        except Queue.Full:
+            evicted = item
+        if evicted is not None:
+            self.__count(topic, 0)
+            if self.__stats is not None:
+                self.__pending(topic, -1)
+
+    def counters(self):
+        """{topic: {'dropped', 'coalesced'}} of the topics with an overflow policy that dropped or merged"""
+        with self.__stats_lock:
+            return {
+                topic: {'dropped': dropped, 'coalesced': coalesced}
+                for topic, (dropped, coalesced) in self.__counters.items()
+            }
+
+    def stats(self):
+        """{topic: {'pending', 'dispatched', 'avg_latency_us', 'max_latency_us'}}, empty without stats"""
+        if self.__stats is None:
+            return {}
+        with self.__stats_lock:
+            return {
+                topic: {
+                    'pending': pending,
+                    'dispatched': dispatched,
+                    'avg_latency_us': total // dispatched if dispatched else 0,
+                    'max_latency_us': latency_max,
+                } for topic, (pending, dispatched, total, latency_max) in self.__stats.items()
+            }
 
     def subscribe(self, topic, listener):
         with self.__topic_manager_lock:
-            listener_list = self.__topic_manager.setdefault(topic, [])
-            listener_list.append(listener)
+            if not _is_pattern(topic):
+                self.__topic_manager[topic] = self.__topic_manager.get(topic, ()) + (listener,)
+            else:
+                node = self.__trie
+                for level in _levels(topic):
+                    child = node[0].get(level)
+                    if child is None:
+                        child = node[0][level] = [{}, ()]
+                    node = child
+                node[1] = node[1] + (listener,)
+                self.__patterns += 1
+            self.__resolved = {}
 
     def unsubscribe(self, topic, listener):
         with self.__topic_manager_lock:
-            listener_list = self.__topic_manager.setdefault(topic, [])
-            try:
-                listener_list.remove(listener)
-            except ValueError:
-                pass
+            if not _is_pattern(topic):
+                listeners = self.__topic_manager.get(topic, ())
+                if listener not in listeners:
+                    return
+                listeners = self.__without(listeners, listener)
+                if listeners:
+                    self.__topic_manager[topic] = listeners
+                else:
+                    del self.__topic_manager[topic]
+            else:
+                path = [(None, self.__trie)]
+                for level in _levels(topic):
+                    child = path[-1][1][0].get(level)
+                    if child is None:
+                        return
+                    path.append((level, child))
+                node = path[-1][1]
+                if listener not in node[1]:
+                    return
+                node[1] = self.__without(node[1], listener)
+                self.__patterns -= 1
+                # prune the branch back to the first node still in use
+                while len(path) > 1 and not path[-1][1][0] and not path[-1][1][1]:
+                    level = path.pop()[0]
+                    del path[-1][1][0][level]
+            self.__resolved = {}
+
+    @staticmethod
+    def __without(listeners, listener):
+        index = listeners.index(listener)
+        return listeners[:index] + listeners[index + 1:]
 
 
 # global publisher
 __publisher__ = None
+__publisher_lock__ = Lock()  # extensions subscribe concurrently from their loader threads
 
 
 def get_default_publisher():
     global __publisher__
     if __publisher__ is None:
-        __publisher__ = Publisher()
-        __publisher__.listen()
+        with __publisher_lock__:
+            if __publisher__ is None:
+                publisher = Publisher()
+                publisher.listen()
+                __publisher__ = publisher
     return __publisher__
 
 
@@ -62,6 +299,12 @@ def publish(topic, **kwargs):
     pub.publish(topic, **kwargs)
 
 
+def set_policy(topic, policy, key=None):
+    """设置主题队列溢出策略"""
+    pub = get_default_publisher()
+    pub.set_policy(topic, policy, key)
+
+
 def subscribe(topic, listener):
     """订阅消息"""
     pub = get_default_publisher()
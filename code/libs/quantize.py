@@ -0,0 +1,50 @@
+"""Numeric sanitation and fixed-point quantization for telemetry values
+
+A Quantizer maps a float onto an integer grid of `1 / scale` resolution, e.g.
+scale 1000 for mm/s² when the value is in m/s². Only arithmetic is used, no
+string conversion, so it is cheap enough to run on every sample.
+"""
+
+
+INF = float('inf')
+
+
+class Quantizer(object):
+
+    def __init__(self, scale, limit=None):
+        """
+        :param scale: steps per unit, e.g. 100 for 0.01 resolution
+        :param limit: absolute value above which a reading is treated as invalid
+        """
+        if scale <= 0:
+            raise ValueError('scale must be greater than 0')
+        self.scale = scale
+        self.limit = INF if limit is None else limit
+
+    def __repr__(self):
+        return '{}(scale={}, limit={})'.format(type(self).__name__, self.scale, self.limit)
+
+    def toInt(self, value):
+        """quantize to a scaled integer, None for NaN/inf/out-of-range readings"""
+        # NaN is the only value not equal to itself; inf fails the limit check
+        if value != value or not -self.limit <= value <= self.limit:
+            return None
+        value *= self.scale
+        return int(value + 0.5) if value >= 0 else -int(0.5 - value)
+
+    def toFloat(self, scaled):
+        return scaled / self.scale
+
+    def __call__(self, value):
+        """quantize to a float rounded to the grid, None for invalid readings"""
+        scaled = self.toInt(value)
+        if scaled is None:
+            return None
+        return scaled / self.scale
+
+    def vector(self, values):
+        """quantize an xyz triple to a TSL struct, None if any axis is invalid"""
+        x, y, z = self(values[0]), self(values[1]), self(values[2])
+        if x is None or y is None or z is None:
+            return None
+        return {1: x, 2: y, 3: z}
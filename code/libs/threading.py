@@ -334,6 +334,34 @@ class Queue(object):
             self.__not_full.notify()
             return item
 
+    def replace(self, func):
+        """replace the first queued item for which `func(item)` returns a new item, return False if none did"""
+        with self.__lock:
+            for index, item in enumerate(self.queue):
+                new_item = func(item)
+                if new_item is not None:
+                    self.queue[index] = new_item
+                    return True
+            return False
+
+    def evict(self, item, predicate):
+        """put without blocking, making room by removing the oldest item matching `predicate` when full
+
+        :return: the evicted item or None, raise Full if the queue is full and no item matched
+        """
+        with self.__not_full:
+            evicted = None
+            if len(self.queue) >= self.__max_size:
+                for index, queued in enumerate(self.queue):
+                    if predicate(queued):
+                        evicted = self.queue.pop(index)
+                        break
+                else:
+                    raise self.Full
+            self._put(item)
+            self.__not_empty.notify()
+            return evicted
+
     def size(self):
         with self.__lock:
             return len(self.queue)
@@ -0,0 +1,18 @@
+"""Event bus topics shared by the extensions, see usr.libs.pypubsub
+
+Samples flow from the producers to QthClient, commands from QthClient to the
+actuators, and status changes to whoever needs them. Listeners receive the
+keyword arguments listed for each topic.
+"""
+
+# samples, sent to the cloud by QthClient
+TSL_REPORT = 'sample/tsl'  # data: {tsl id: value}, dropped while offline or when the queue is full
+
+# commands from the cloud, delivered synchronously in the Qth callback thread
+FAN_SWITCH = 'command/fan/switch'  # value: bool
+FAN_MODE = 'command/fan/mode'  # value: int, 1 low / 2 medium / 3 high
+BUZZER_SWITCH = 'command/buzzer/switch'  # value: bool
+LBS_REPORT = 'command/lbs/report'  # no arguments, queued requests are coalesced
+
+# status changes
+NETWORK = 'status/network'  # ready: bool, data call state from NetService
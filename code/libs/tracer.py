@@ -0,0 +1,89 @@
+"""Startup tracer with named phases timestamped by utime.ticks_us
+
+    from usr.libs.tracer import boot
+
+    with boot.phase('create_app'):
+        app = create_app()
+    boot.begin('network')       # ended from a callback later
+    boot.end('network')
+
+Times are relative to the first import of this module. `Application.run` prints
+the timeline once all blocking extensions are loaded; phases still running at
+that point (non-blocking extensions, network attach) show up as open.
+"""
+import utime
+from .threading import Lock, Event
+
+
+class _Phase(object):
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.tracer.begin(self.name)
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.tracer.end(self.name)
+
+
+class Tracer(object):
+
+    def __init__(self):
+        self.__t0 = utime.ticks_us()
+        self.__phases = []  # [name, start us, end us or None]
+        self.__lock = Lock()
+        self.finished = Event()
+
+    def __now(self):
+        return utime.ticks_diff(utime.ticks_us(), self.__t0)
+
+    def begin(self, name):
+        with self.__lock:
+            self.__phases.append([name, self.__now(), None])
+
+    def end(self, name):
+        """close the latest open phase called `name`, ignored if there is none"""
+        now = self.__now()
+        with self.__lock:
+            for phase in reversed(self.__phases):
+                if phase[0] == name and phase[2] is None:
+                    phase[2] = now
+                    return
+
+    def phase(self, name):
+        """context manager tracing the enclosed block"""
+        return _Phase(self, name)
+
+    def mark(self, name):
+        now = self.__now()
+        with self.__lock:
+            self.__phases.append([name, now, now])
+
+    def timeline(self):
+        """[(name, start ms, duration ms or None while open)] in start order"""
+        with self.__lock:
+            phases = sorted(self.__phases, key=lambda phase: phase[1])
+        return [(name, start // 1000, None if end is None else (end - start) // 1000) for name, start, end in phases]
+
+    def finish(self):
+        self.mark('ready')
+        self.finished.set()
+
+    def report(self):
+        lines = ['boot timeline (ms):']
+        for name, start, duration in self.timeline():
+            lines.append('{:>8} {:>8}  {}'.format(start, '...' if duration is None else '+{}'.format(duration), name))
+        return '\r\n'.join(lines)
+
+    def summary(self):
+        """compact single line timeline "name@start+duration;..." for diagnostics upload"""
+        return ';'.join(
+            '{}@{}{}'.format(name, start, '' if duration is None else '+{}'.format(duration))
+            for name, start, duration in self.timeline()
+        )
+
+
+boot = Tracer()
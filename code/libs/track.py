@@ -0,0 +1,104 @@
+"""Online trajectory simplification for batched GNSS upload
+
+Fixes are reduced with an opening-window variant of Douglas-Peucker: a
+point only becomes a key point when the straight line from the previous key
+point can no longer represent the buffered fixes within `tolerance` meters.
+Straight or stationary stretches therefore collapse to their endpoints and
+the number of kept points follows the path complexity, not the time. Once a
+segment buffers `window` fixes, every other one of its inner fixes is dropped
+from the deviation check, which bounds CPU and RAM without cutting the segment.
+
+A flush is due when the oldest kept point is `max_age` seconds old, when
+`max_points` key points are kept, or on a turn sharper than `turn_angle`.
+"""
+from .geo import Origin, cos, radians
+
+
+class TrackBuffer(object):
+    T = 0
+    LAT = 1
+    LNG = 2
+
+    def __init__(self, tolerance=10, max_points=64, max_age=300, turn_angle=45, window=32):
+        """
+        :param tolerance: max deviation of a dropped fix from the simplified path, meters
+        :param max_points: key points per batch
+        :param max_age: seconds between the first kept point and a flush
+        :param turn_angle: heading change, degrees, that triggers a flush
+        :param window: max fixes examined per segment, the inner ones are thinned beyond it
+        """
+        self.tolerance = tolerance
+        self.max_points = max_points
+        self.max_age = max_age
+        self.turn_cos = cos(radians(turn_angle))
+        self.__anchor = None  # Origin of the last key point
+        self.window = window
+        self.__points = []  # key points (t, lat, lng)
+        self.__window = []  # fixes since the last key point
+        self.__turned = False
+
+    def __len__(self):
+        return len(self.__points) + (1 if self.__window else 0)
+
+    def add(self, t, lat, lng):
+        """add a fix, return True if the batch should be flushed"""
+        point = (t, lat, lng)
+        if not self.__points:
+            self.__keep(point)
+            return False
+        window = self.__window
+        window.append(point)
+        if self.__deviation() > self.tolerance:
+            # the previous fix is the last one the current segment represents
+            self.__keep(window[-2])
+            self.__window = [point]
+        elif len(window) > self.window:
+            # keep the newest fix (the segment end) and every other inner one
+            self.__window = window[-2::-2][::-1] + [point]
+        if not self.__turned and len(self.__points) >= 2:
+            self.__turned = self.__is_turn(self.__points[-2], point)
+        return self.__turned or len(self.__points) >= self.max_points or t - self.__points[0][self.T] >= self.max_age
+
+    def flush(self):
+        """return the simplified track and restart from its last point"""
+        points = self.__points
+        if self.__window:
+            points.append(self.__window[-1])
+        self.__points = []
+        if points:
+            self.__keep(points[-1])
+        self.__window = []
+        self.__turned = False
+        return points
+
+    def __keep(self, point):
+        self.__points.append(point)
+        self.__anchor = Origin(point[self.LAT], point[self.LNG])
+
+    def __deviation(self):
+        # max distance of the buffered fixes from the line last key point -> newest fix
+        anchor = self.__anchor
+        ex, ey = anchor.project(self.__window[-1][self.LAT], self.__window[-1][self.LNG])
+        length = (ex * ex + ey * ey) ** 0.5
+        result = 0.0
+        for point in self.__window[:-1]:
+            px, py = anchor.project(point[self.LAT], point[self.LNG])
+            if length < 1e-3:
+                distance = (px * px + py * py) ** 0.5
+            else:
+                distance = abs(ex * py - ey * px) / length
+            if distance > result:
+                result = distance
+        return result
+
+    def __is_turn(self, previous, point):
+        # heading previous -> anchor versus anchor -> point, once the latter is long enough to be reliable
+        anchor = self.__anchor
+        ax, ay = anchor.project(previous[self.LAT], previous[self.LNG])
+        ax, ay = -ax, -ay
+        bx, by = anchor.project(point[self.LAT], point[self.LNG])
+        b_length = (bx * bx + by * by) ** 0.5
+        if b_length < 2 * self.tolerance:
+            return False
+        norm = (ax * ax + ay * ay) ** 0.5 * b_length
+        return norm > 0 and (ax * bx + ay * by) / norm < self.turn_cos
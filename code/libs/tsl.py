@@ -0,0 +1,155 @@
+"""TSL property model
+
+Services declare every TSL property they own once: id, data source, field,
+kind and value format. Reads are served by responders precompiled per
+requested id set, which only poll the sources those ids need.
+"""
+
+
+from .threading import Lock
+
+
+BOOL = 0
+INT = 1
+FLOAT = 2
+VECTOR = 3  # xyz triple, reported as struct {1: x, 2: y, 3: z}
+
+
+def _converter(kind, fmt):
+    if kind == BOOL:
+        return bool
+    if kind == INT:
+        return int
+    if kind == FLOAT:
+        return fmt or float
+    if kind == VECTOR:
+        if fmt is None:
+            return lambda v: {1: v[0], 2: v[1], 3: v[2]}
+
+        def vector(v):
+            x, y, z = fmt(v[0]), fmt(v[1]), fmt(v[2])
+            if x is None or y is None or z is None:
+                return None
+            return {1: x, 2: y, 3: z}
+        return vector
+    raise ValueError('unknown tsl kind \"{}\"'.format(kind))
+
+
+class _Responder(object):
+
+    def __init__(self, getters, props):
+        self.__getters = getters  # tuple of source getters
+        self.__props = props  # tuple of (tsl_id, source slot, field, converter)
+
+    def __call__(self):
+        readings = []
+        for getter in self.__getters:
+            try:
+                readings.append(getter())
+            except Exception:
+                readings.append(None)
+        value = {}
+        for tsl_id, slot, field, convert in self.__props:
+            reading = readings[slot]
+            if reading is None:
+                continue
+            try:
+                converted = convert(reading if field is None else reading[field])
+            except Exception:
+                continue
+            if converted is not None:
+                value[tsl_id] = converted
+        return value
+
+
+class TslModel(object):
+    MAX_RESPONDERS = 16
+
+    def __init__(self):
+        self.__lock = Lock()
+        self.__sources = {}  # source name -> getter
+        self.__properties = {}  # tsl id -> (source name, field, converter)
+        self.__responders = {}  # tuple of tsl ids -> _Responder
+
+    def add_source(self, name, getter):
+        """register a reading source, polled at most once per read
+
+        :param name: unique source name
+        :param getter: callable returning the reading, raise if unavailable
+        """
+        with self.__lock:
+            self.__sources[name] = getter
+            self.__responders.clear()
+
+    def add_property(self, tsl_id, source, field=None, kind=FLOAT, fmt=None):
+        """declare a TSL property
+
+        :param tsl_id: TSL property id
+        :param source: name of the source providing the reading
+        :param field: index/key of the value inside the reading, None for the whole reading
+        :param kind: BOOL, INT, FLOAT or VECTOR
+        :param fmt: callable applied to FLOAT values (each axis for VECTOR), a None result drops the value
+        """
+        with self.__lock:
+            if tsl_id in self.__properties:
+                raise ValueError('tsl id \"{}\" already declared'.format(tsl_id))
+            self.__properties[tsl_id] = (source, field, _converter(kind, fmt))
+            self.__responders.clear()
+
+    def ids(self):
+        return list(self.__properties.keys())
+
+    def responder(self, ids):
+        key = tuple(ids)
+        with self.__lock:
+            responder = self.__responders.get(key)
+            if responder is None:
+                responder = self.__compile(key)
+                if len(self.__responders) >= self.MAX_RESPONDERS:
+                    self.__responders.clear()
+                self.__responders[key] = responder
+            return responder
+
+    def __compile(self, ids):
+        slots = {}
+        getters = []
+        props = []
+        for tsl_id in ids:
+            prop = self.__properties.get(tsl_id)
+            if prop is None:
+                continue
+            source, field, convert = prop
+            getter = self.__sources.get(source)
+            if getter is None:
+                continue
+            if source not in slots:
+                slots[source] = len(getters)
+                getters.append(getter)
+            props.append((tsl_id, slots[source], field, convert))
+        return _Responder(tuple(getters), tuple(props))
+
+    def read(self, ids):
+        return self.responder(ids)()
+
+
+# global model
+__model__ = None
+
+
+def get_default_model():
+    global __model__
+    if __model__ is None:
+        __model__ = TslModel()
+    return __model__
+
+
+def add_source(name, getter):
+    get_default_model().add_source(name, getter)
+
+
+def add_property(tsl_id, source, field=None, kind=FLOAT, fmt=None):
+    get_default_model().add_property(tsl_id, source, field=field, kind=kind, fmt=fmt)
+
+
+def read(ids):
+    return get_default_model().read(ids)
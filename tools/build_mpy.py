@@ -0,0 +1,239 @@
+"""Host-side build of a precompiled .mpy bundle of the application
+
+Cross-compiles `code/` with mpy-cross so the module imports bytecode instead of
+compiling sources at every boot, which saves import time and the compiler's
+heap. `main.py` stays source (it is the firmware entry point), data files and
+the vendored Qth .mpy files are copied as is, and debug-only modules are left
+out. The bundle goes to `build/usr` (deploy it as /usr) with a `manifest.json`.
+
+The .mpy format (version, unicode flag, small int size) must match the firmware.
+It is taken from the vendored Qth .mpy files, checked against
+`mpy-cross --version` and verified on every compiled file:
+
+    pip install "mpy-cross==1.18"    # mpy v5, matches the EG912U firmware
+    python tools/build_mpy.py
+
+Compare the boot timelines printed by Application.run (see usr.libs.tracer),
+captured from the serial log before and after deploying the bundle:
+
+    python tools/build_mpy.py --compare source.log bundle.log
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SRC = os.path.join(ROOT, 'code')
+DEFAULT_OUT = os.path.join(ROOT, 'build', 'usr')
+
+ENTRY_POINTS = ('main.py',)  # run as source by the firmware
+DEBUG_ONLY = ('benchmark.py', 'vsim_test.py', 'buzzer.py')  # REPL benchmarks and standalone test scripts
+SKIP_DIRS = ('__pycache__',)
+VERSION_PROBE = 'Qth'  # vendored .mpy package the firmware already accepts
+MPY_FLAG_UNICODE = 0x02  # header feature flag: compiled with unicode strings
+
+
+class BuildError(Exception):
+    pass
+
+
+def mpy_header(path):
+    """(version, feature flags, small int bits) from the header of a .mpy file"""
+    with open(path, 'rb') as f:
+        header = f.read(4)
+    if len(header) < 4 or header[0:1] != b'M':
+        raise BuildError('{} is not a .mpy file'.format(path))
+    return header[1], header[2], header[3]
+
+
+def firmware_mpy_header(src):
+    probe = os.path.join(src, VERSION_PROBE)
+    headers = set()
+    if os.path.isdir(probe):
+        for name in os.listdir(probe):
+            if name.endswith('.mpy'):
+                headers.add(mpy_header(os.path.join(probe, name)))
+    if len(headers) != 1:
+        raise BuildError('cannot infer the firmware .mpy format from {} (found {}), pass --mpy-version'.format(
+            probe, sorted(headers)))
+    return headers.pop()
+
+
+def feature_options(flags, small_int_bits):
+    """mpy-cross options reproducing the firmware's feature flags"""
+    options = ['-msmall-int-bits={}'.format(small_int_bits)]
+    if not flags & MPY_FLAG_UNICODE:
+        options.append('-mno-unicode')
+    return options
+
+
+def mpy_cross_version(mpy_cross):
+    try:
+        output = subprocess.check_output([mpy_cross, '--version'], stderr=subprocess.STDOUT).decode()
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise BuildError('cannot run {}: {}'.format(mpy_cross, e))
+    match = re.search(r'mpy v(\d+)', output)
+    if match is None:
+        raise BuildError('unexpected {} --version output: {}'.format(mpy_cross, output.strip()))
+    return int(match.group(1)), output.strip()
+
+
+def sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        digest.update(f.read())
+    return digest.hexdigest()
+
+
+def collect(src):
+    """yield (relative path, action) with action 'compile', 'copy' or 'strip'"""
+    for dirpath, dirnames, filenames in os.walk(src):
+        dirnames[:] = sorted(d for d in dirnames if d not in SKIP_DIRS)
+        for name in sorted(filenames):
+            rel = os.path.relpath(os.path.join(dirpath, name), src).replace(os.sep, '/')
+            if name.endswith(('.pyc', '.pyo')):
+                continue
+            if rel in DEBUG_ONLY:
+                yield rel, 'strip'
+            elif name.endswith('.py') and rel not in ENTRY_POINTS:
+                yield rel, 'compile'
+            else:
+                yield rel, 'copy'
+
+
+def build(src, out, mpy_cross, mpy_version=None, opt=None, keep_debug=False):
+    if mpy_version is None:
+        header = firmware_mpy_header(src)
+        required = header[0]
+        options = feature_options(header[1], header[2])
+    else:
+        header = None
+        required = mpy_version
+        options = []
+    if opt is not None:
+        options.append('-O{}'.format(opt))
+    emitted, version_text = mpy_cross_version(mpy_cross)
+    if emitted != required:
+        raise BuildError('{} emits mpy v{} but the firmware needs v{}, install the matching mpy-cross'.format(
+            mpy_cross, emitted, required))
+
+    if os.path.isdir(out):
+        shutil.rmtree(out)
+    files = []
+    stripped = []
+    source_size = 0
+    for rel, action in collect(src):
+        if action == 'strip' and not keep_debug:
+            stripped.append(rel)
+            continue
+        source = os.path.join(src, rel)
+        target_rel = rel[:-3] + '.mpy' if action == 'compile' else rel
+        target = os.path.join(out, target_rel)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if action == 'compile':
+            command = [mpy_cross, '-o', target, '-s', 'usr/' + rel] + options + [source]
+            result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            if result.returncode != 0:
+                raise BuildError('mpy-cross failed on {}:\n{}'.format(rel, result.stdout.decode()))
+            if header is not None and mpy_header(target) != header:
+                raise BuildError('{} header {} does not match the firmware {}'.format(target_rel, mpy_header(target), header))
+        else:
+            shutil.copyfile(source, target)
+        source_size += os.path.getsize(source)
+        files.append({
+            'path': 'usr/' + target_rel,
+            'source': rel,
+            'size': os.path.getsize(target),
+            'sha256': sha256(target),
+        })
+
+    manifest = {
+        'mpy_version': required,
+        'mpy_cross': version_text,
+        'options': options,
+        'source_size': source_size,
+        'bundle_size': sum(item['size'] for item in files),
+        'stripped': stripped,
+        'files': files,
+    }
+    with open(os.path.join(out, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+TIMELINE_HEADER = 'boot timeline (ms):'
+TIMELINE_LINE = re.compile(r'^\s*(\d+)\s+(\+\d+|\.\.\.)\s+(.+?)\s*$')
+
+
+def parse_timeline(path):
+    """phase name -> (start ms, duration ms or None) from the last timeline printed in a log"""
+    phases = None
+    collecting = False
+    with open(path, encoding='utf-8', errors='replace') as f:
+        for line in f:
+            if TIMELINE_HEADER in line:
+                phases = {}
+                collecting = True
+                continue
+            if not collecting:
+                continue
+            match = TIMELINE_LINE.match(line)
+            if match is None:
+                collecting = not phases  # timeline ends at the first other line after its entries
+                continue
+            start, duration, name = match.groups()
+            phases[name] = (int(start), None if duration == '...' else int(duration[1:]))
+    if not phases:
+        raise BuildError('no boot timeline found in {}'.format(path))
+    return phases
+
+
+def compare(before_path, after_path, out=sys.stdout):
+    before = parse_timeline(before_path)
+    after = parse_timeline(after_path)
+    out.write('{:<28} {:>10} {:>10} {:>8}\n'.format('phase (duration ms)', 'before', 'after', 'delta'))
+    names = sorted(set(before) | set(after), key=lambda name: (after.get(name) or before.get(name))[0])
+    for name in names:
+        b = (before.get(name) or (None, None))[1]
+        a = (after.get(name) or (None, None))[1]
+        delta = '' if a is None or b is None else '{:+d}'.format(a - b)
+        out.write('{:<28} {:>10} {:>10} {:>8}\n'.format(name, '-' if b is None else b, '-' if a is None else a, delta))
+    if 'ready' in before and 'ready' in after:
+        b, a = before['ready'][0], after['ready'][0]
+        out.write('{:<28} {:>10} {:>10} {:>8}\n'.format('ready at', b, a, '{:+d}'.format(a - b)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--src', default=DEFAULT_SRC, help='application sources (default: code/)')
+    parser.add_argument('--out', default=DEFAULT_OUT, help='bundle directory (default: build/usr)')
+    parser.add_argument('--mpy-cross', default='mpy-cross', help='mpy-cross executable')
+    parser.add_argument('--mpy-version', type=int, help='required .mpy version, default: format of the vendored Qth package')
+    parser.add_argument('--opt', type=int, choices=range(4), help='mpy-cross optimization level (-O)')
+    parser.add_argument('--keep-debug', action='store_true', help='also bundle debug-only modules')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE_LOG', 'AFTER_LOG'),
+                        help='compare the boot timelines of two serial logs instead of building')
+    args = parser.parse_args(argv)
+    try:
+        if args.compare:
+            compare(*args.compare)
+            return 0
+        manifest = build(args.src, args.out, args.mpy_cross, args.mpy_version, args.opt, args.keep_debug)
+    except BuildError as e:
+        sys.stderr.write('error: {}\n'.format(e))
+        return 1
+    print('bundle {}: {} files, {} bytes (sources {} bytes), mpy v{}'.format(
+        args.out, len(manifest['files']), manifest['bundle_size'], manifest['source_size'], manifest['mpy_version']))
+    if manifest['stripped']:
+        print('stripped debug-only modules: {}'.format(', '.join(manifest['stripped'])))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
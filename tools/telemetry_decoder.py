@@ -0,0 +1,107 @@
+"""Host-side decoder for SIMPLI Kit binary telemetry frames
+
+Decodes frames produced by `code/libs/frame.py` (received through the Qth
+passthrough channel). Usage:
+
+    python telemetry_decoder.py frame.bin
+    python telemetry_decoder.py --hex 534b0101...
+"""
+import argparse
+import json
+import struct
+import sys
+
+
+MAGIC = b'SK'
+SUPPORTED_VERSIONS = (1,)
+FRAME_TYPES = {1: 'samples', 2: 'track'}
+
+HEADER = struct.Struct('>2sBBBHIH')
+CHANNEL = struct.Struct('>BHi')
+DELTA = struct.Struct('>h')
+ESCAPED = struct.Struct('>i')
+DELTA_ESCAPE = -0x8000
+
+
+class FrameError(ValueError):
+    pass
+
+
+def decode(data):
+    """Decode one frame.
+
+    Returns a dict with `version`, `type`, `t0` (device seconds), `interval_ms`,
+    `timestamps` (seconds, one per sample) and `channels` mapping channel id to
+    the list of real values.
+    """
+    data = bytes(data)
+    if len(data) < HEADER.size:
+        raise FrameError('frame too short: {} bytes'.format(len(data)))
+    magic, version, frame_type, channel_count, sample_count, t0, interval_ms = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise FrameError('bad magic {!r}'.format(magic))
+    if version not in SUPPORTED_VERSIONS:
+        raise FrameError('unsupported frame version {}'.format(version))
+
+    offset = HEADER.size
+    channels = []
+    for _ in range(channel_count):
+        if offset + CHANNEL.size > len(data):
+            raise FrameError('truncated channel table')
+        channels.append(CHANNEL.unpack_from(data, offset))
+        offset += CHANNEL.size
+
+    series = {channel_id: [first] if sample_count else [] for channel_id, _, first in channels}
+    for _ in range(max(sample_count - 1, 0)):
+        for channel_id, _, _ in channels:
+            if offset + DELTA.size > len(data):
+                raise FrameError('truncated body')
+            (delta,) = DELTA.unpack_from(data, offset)
+            offset += DELTA.size
+            if delta == DELTA_ESCAPE:
+                if offset + ESCAPED.size > len(data):
+                    raise FrameError('truncated escaped value')
+                (value,) = ESCAPED.unpack_from(data, offset)
+                offset += ESCAPED.size
+            else:
+                value = series[channel_id][-1] + delta
+            series[channel_id].append(value)
+    if offset != len(data):
+        raise FrameError('{} trailing bytes'.format(len(data) - offset))
+
+    scales = {channel_id: scale for channel_id, scale, _ in channels}
+    return {
+        'version': version,
+        'type': FRAME_TYPES.get(frame_type, frame_type),
+        't0': t0,
+        'interval_ms': interval_ms,
+        'timestamps': [t0 + i * interval_ms / 1000.0 for i in range(sample_count)],
+        'channels': {
+            channel_id: [value / scales[channel_id] for value in values]
+            for channel_id, values in series.items()
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('frame', help='binary frame file, or hex string with --hex')
+    parser.add_argument('--hex', action='store_true', help='treat FRAME as a hex string')
+    args = parser.parse_args(argv)
+
+    if args.hex:
+        data = bytes.fromhex(args.frame)
+    else:
+        with open(args.frame, 'rb') as f:
+            data = f.read()
+    try:
+        frame = decode(data)
+    except FrameError as e:
+        print('error: {}'.format(e), file=sys.stderr)
+        return 1
+    print(json.dumps(frame, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())